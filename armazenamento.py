@@ -0,0 +1,313 @@
+import pandas as pd
+import numpy as np
+
+from instrumentacao import count_io
+
+# --- ESCRITA NA PLANILHA ---
+# A posição de cada linha do DataFrame na planilha é dada pelo índice: a linha
+# de rótulo L ocupa a linha L + 2 da aba (a linha 1 é o cabeçalho). A coluna de
+# cada campo é a do seu nome no cabeçalho da aba, que pode ter outras colunas
+# além das lidas pelo app. Os caminhos
+# de gravação preservam os rótulos das linhas existentes, o que permite enviar
+# apenas as linhas alteradas em vez de reescrever a aba inteira.
+
+WORKSHEET = "Musicas"
+FIRST_DATA_ROW = 2
+TRACK_COLUMNS = ['trackNumber', 'title', 'artists', 'album', 'year', 'composers']
+RATING_PREFIX = "rating_"
+# Usuários com coluna de nota garantida; cada coluna rating_<usuário> a mais nos dados é outro usuário
+USERS = ["jom", "jov", "job"]
+COLUMNS = TRACK_COLUMNS + [f"{RATING_PREFIX}{u}" for u in USERS]
+
+
+def rating_columns(df):
+    """Colunas de nota (rating_<usuário>) do DataFrame, na ordem em que aparecem."""
+    return [col for col in df.columns if isinstance(col, str) and col.startswith(RATING_PREFIX)]
+
+
+def rating_users(df):
+    """Usuários com coluna de nota no DataFrame, na ordem das colunas."""
+    return [col[len(RATING_PREFIX):] for col in rating_columns(df)]
+
+# --- REPRESENTAÇÃO COMPACTA ---
+# Artistas, álbuns e compositores se repetem em muitas faixas e ficam como
+# categorias; títulos ficam em texto do Arrow, número da faixa e ano viram
+# inteiros anuláveis de 16 bits e as notas (em passos de 0,5) cabem em float32. Os valores gravados na planilha ou
+# no banco são os mesmos da representação original.
+
+CATEGORY_COLUMNS = ['artists', 'album', 'composers']
+SMALL_INT_COLUMNS = ['trackNumber', 'year']
+
+
+def _small_int(series):
+    """Converte uma coluna numérica para Int16 quando todos os valores são inteiros que cabem nele."""
+    values = series.dropna()
+    if len(values) and ((values % 1 != 0).any() or values.abs().max() > np.iinfo(np.int16).max):
+        return series
+    return series.astype('Int16')
+
+
+def compact_dataframe(df):
+    """Converte as colunas da biblioteca para os tipos compactos."""
+    for col in CATEGORY_COLUMNS:
+        df[col] = df[col].astype('category')
+    df['title'] = df['title'].astype('string[pyarrow]')
+    for col in SMALL_INT_COLUMNS:
+        df[col] = _small_int(df[col])
+    for col in rating_columns(df):
+        df[col] = df[col].astype('float32')
+    return df
+
+
+def prepare_dataframe(df, compact=True):
+    """Remove linhas vazias, converte as colunas numéricas da planilha e compacta os tipos."""
+    # Só as colunas da faixa e as de nota; colunas sem cabeçalho da planilha são ignoradas
+    ratings = rating_columns(df)
+    df = df[[col for col in df.columns if col in TRACK_COLUMNS or col in ratings]]
+    df = df.dropna(how="all") # Remove linhas completamente vazias
+
+    # Garante que as colunas de avaliação existam
+    for u in USERS:
+        col_name = f"{RATING_PREFIX}{u}"
+        if col_name not in df.columns:
+            df[col_name] = np.nan
+
+    # Conversão de tipos e tratamento de dados
+    df['trackNumber'] = pd.to_numeric(df['trackNumber'], errors='coerce')
+    df['year'] = pd.to_numeric(df['year'], errors='coerce')
+    for col in rating_columns(df):
+        df[col] = pd.to_numeric(df[col], errors='coerce')
+    return compact_dataframe(df) if compact else df
+
+
+def widen_floats(df):
+    """Converte colunas float32 para float64 no valor decimal que representam (7.3, não 7.300000190734863)."""
+    columns = df.select_dtypes('float32').columns
+    if columns.empty:
+        return df
+    return df.astype({col: 'float64' for col in columns}).round({col: 6 for col in columns})
+
+
+def _with_categories(column, values):
+    """Acrescenta a uma coluna categórica as categorias de `values` que ela ainda não tem."""
+    new = pd.Index(pd.Series(values, dtype=object).dropna().unique()).difference(column.cat.categories)
+    return column.cat.add_categories(new) if len(new) else column
+
+
+def set_cells(df, rows, col, values):
+    """Atribui `values` à coluna `col` nas linhas `rows` de `df`, ampliando as categorias quando preciso."""
+    if isinstance(df[col].dtype, pd.CategoricalDtype):
+        df[col] = _with_categories(df[col], values)
+    df.loc[rows, col] = values
+
+
+def column_letter(position):
+    """Converte uma posição de coluna (começando em 1) para a letra da planilha."""
+    letters = ""
+    while position > 0:
+        position, remainder = divmod(position - 1, 26)
+        letters = chr(65 + remainder) + letters
+    return letters
+
+
+def cell_value(value):
+    """Converte um valor do DataFrame para o formato enviado à planilha."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return ""
+    if isinstance(value, (float, np.floating)) and float(value).is_integer():
+        return int(value)
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def with_new_rows(df, new_rows):
+    """Anexa novas linhas ao DataFrame com rótulos após a última linha existente."""
+    new_df = pd.DataFrame(new_rows, columns=df.columns)
+    start = int(df.index.max()) + 1 if len(df.index) else 0
+    new_df.index = pd.RangeIndex(start, start + len(new_df))
+    # Mantém os tipos compactos: as categorias novas entram antes da concatenação
+    df = df.assign(**{
+        col: _with_categories(df[col], new_df[col])
+        for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)
+    })
+    new_df = new_df.astype(df.dtypes.to_dict())
+    return pd.concat([df, new_df])
+
+
+def _same_column(before, after):
+    """Compara duas colunas elemento a elemento, tratando nulos dos dois lados como iguais."""
+    if isinstance(before.dtype, pd.CategoricalDtype) and isinstance(after.dtype, pd.CategoricalDtype):
+        categories = before.cat.categories
+        if after.cat.categories is categories or after.cat.categories[:len(categories)].equals(categories):
+            # Mesmas categorias (ou só acrescidas): basta comparar os códigos
+            return before.cat.codes.to_numpy() == after.cat.codes.to_numpy()
+    if isinstance(before.dtype, pd.CategoricalDtype):
+        before = before.astype(object)
+    if isinstance(after.dtype, pd.CategoricalDtype):
+        after = after.astype(object)
+    same = (before == after) | (before.isna() & after.isna())
+    return same.fillna(False).to_numpy(dtype=bool)
+
+
+def changed_cells(before, after):
+    """Matriz booleana (linhas × colunas) das células que mudaram entre dois DataFrames alinhados."""
+    return np.column_stack([~_same_column(before[col], after[col]) for col in before.columns])
+
+
+def compute_changes(original, updated, columns):
+    """Compara dois DataFrames e retorna as linhas alteradas, adicionadas e removidas."""
+    common = original.index.intersection(updated.index)
+    before = original.loc[common, columns]
+    after = updated.loc[common, columns]
+    changed = after[changed_cells(before, after).any(axis=1)]
+    added = updated.loc[updated.index.difference(original.index), columns]
+    removed = original.index.difference(updated.index)
+    return changed, added, removed
+
+
+def _contiguous_runs(rows):
+    """Agrupa números de linha ordenados em intervalos contíguos (início, fim)."""
+    runs = []
+    for row in rows:
+        if runs and row == runs[-1][1] + 1:
+            runs[-1][1] = row
+        else:
+            runs.append([row, row])
+    return runs
+
+
+def _sheet_positions(worksheet, columns):
+    """Posição (a partir de 0) de cada coluna na aba, pelo cabeçalho; None se alguma falta ou se repete."""
+    header = worksheet.row_values(1)
+    count_io('sheet_header')
+    if any(header.count(col) != 1 for col in columns):
+        return None
+    return [header.index(col) for col in columns]
+
+
+def _column_segments(positions):
+    """Agrupa as colunas do DataFrame em trechos que ocupam colunas vizinhas na aba.
+
+    Retorna pares (primeira, última) de posições no DataFrame.
+    """
+    segments = []
+    for i, position in enumerate(positions):
+        if segments and position == positions[segments[-1][1]] + 1:
+            segments[-1][1] = i
+        else:
+            segments.append([i, i])
+    return segments
+
+
+def _changed_spans(original, changed, columns, segments):
+    """Para cada trecho de colunas, retorna (rótulo, primeira, última coluna alterada) das linhas que mudaram nele."""
+    before = original.loc[changed.index, columns]
+    differs = changed_cells(before, changed)
+    for start, end in segments:
+        part = differs[:, start:end + 1]
+        rows = part.any(axis=1)
+        first = start + part.argmax(axis=1)
+        last = end - part[:, ::-1].argmax(axis=1)
+        yield from zip(changed.index[rows], first[rows], last[rows])
+
+
+def _range_data(block, start, end, first_col):
+    """Monta uma entrada de atualização em lote para um bloco retangular de células a partir da coluna `first_col` da aba."""
+    last_col = first_col + block.shape[1] - 1
+    return {
+        'range': f"{column_letter(first_col + 1)}{start + FIRST_DATA_ROW}:{column_letter(last_col + 1)}{end + FIRST_DATA_ROW}",
+        'values': [[cell_value(v) for v in row] for row in widen_floats(block).itertuples(index=False)],
+    }
+
+
+def _write_delta(worksheet, original, updated, columns, positions):
+    """Envia à aba apenas as diferenças entre `original` e `updated`.
+
+    `positions` dá a coluna da aba de cada coluna do DataFrame. Linhas
+    alteradas enviam só o trecho entre a primeira e a última célula modificada
+    de cada grupo de colunas vizinhas na aba; linhas novas são escritas logo
+    após a última linha, deixando vazias as colunas que o app não lê. Faz no
+    máximo três chamadas de gravação: uma para os valores, uma para aumentar a grade
+    quando necessário e uma para remover linhas.
+    """
+    changed, added, removed = compute_changes(original, updated, columns)
+    changed = changed.sort_index()
+
+    next_row = int(original.index.max()) + 1 if len(original.index) else 0
+    added = added.copy()
+    added.index = pd.RangeIndex(next_row, next_row + len(added))
+
+    # Agrupa linhas consecutivas que mudaram no mesmo trecho de colunas
+    runs = []
+    segments = _column_segments(positions)
+    for label, first_col, last_col in _changed_spans(original, changed, columns, segments):
+        if runs and label == runs[-1][1] + 1 and runs[-1][2] == (first_col, last_col):
+            runs[-1][1] = label
+        else:
+            runs.append([label, label, (first_col, last_col)])
+
+    data = []
+    for start, end, (first_col, last_col) in runs:
+        block = changed.loc[start:end].iloc[:, first_col:last_col + 1]
+        data.append(_range_data(block, start, end, positions[first_col]))
+    for start, end in _contiguous_runs(added.index.tolist()):
+        for first_col, last_col in segments:
+            block = added.loc[start:end].iloc[:, first_col:last_col + 1]
+            data.append(_range_data(block, start, end, positions[first_col]))
+
+    if len(added):
+        needed_rows = int(added.index.max()) + FIRST_DATA_ROW
+        if needed_rows > worksheet.row_count:
+            worksheet.add_rows(needed_rows - worksheet.row_count)
+            count_io('sheet_add_rows')
+    if data:
+        worksheet.batch_update(data, value_input_option="USER_ENTERED")
+        count_io('sheet_batch_update', rows=len(changed) + len(added), cells=sum(len(r) for d in data for r in d['values']))
+
+    if len(removed):
+        requests = [
+            {'deleteDimension': {'range': {
+                'sheetId': worksheet.id, 'dimension': 'ROWS',
+                'startIndex': start + FIRST_DATA_ROW - 1, 'endIndex': end + FIRST_DATA_ROW,
+            }}}
+            for start, end in reversed(_contiguous_runs(sorted(removed.tolist())))
+        ]
+        worksheet.spreadsheet.batch_update({'requests': requests})
+        count_io('sheet_delete_rows', rows=len(removed))
+
+    # Reindexa para refletir as posições na aba depois das remoções
+    result = pd.concat([updated.loc[updated.index.intersection(original.index)], added])
+    removed_sorted = np.sort(removed.to_numpy())
+    result.index = result.index - np.searchsorted(removed_sorted, result.index.to_numpy())
+    return result.sort_index()
+
+
+def _worksheet(conn, worksheet):
+    """Aba do gspread por trás da conexão, ou None se o cliente não dá acesso a ela."""
+    select = getattr(getattr(conn, 'client', None), '_select_worksheet', None)
+    return select(worksheet=worksheet) if select is not None else None
+
+
+def save_changes(conn, original, updated, worksheet=WORKSHEET):
+    """Grava `updated` na planilha enviando apenas as linhas que mudaram.
+
+    Quando a gravação incremental não é possível (cliente sem acesso à aba,
+    colunas diferentes das lidas ou ausentes do cabeçalho), reescreve a aba inteira como antes. Erros da
+    API não levam à reescrita: são repassados para quem chamou tentar de novo.
+    Retorna o DataFrame com o índice alinhado às linhas da planilha.
+    """
+    columns = list(original.columns)
+    sheet = positions = None
+    if list(updated.columns) == columns and updated.index.is_unique:
+        sheet = _worksheet(conn, worksheet)
+    if sheet is not None:
+        positions = _sheet_positions(sheet, columns)
+    if positions is None:
+        full = widen_floats(updated.reset_index(drop=True))
+        conn.update(worksheet=worksheet, data=full)
+        count_io('sheet_full_rewrite', rows=len(full), cells=full.size)
+        return full
+    return _write_delta(sheet, original, updated, columns, positions)
@@ -0,0 +1,216 @@
+import sqlite3
+from contextlib import closing
+
+import pandas as pd
+import numpy as np
+
+from armazenamento import (
+    TRACK_COLUMNS, USERS, WORKSHEET, compute_changes, prepare_dataframe, rating_columns, rating_users, save_changes,
+    widen_floats,
+)
+from instrumentacao import count_io
+from replica import load_library, record_write, sheet_version
+
+# --- BACKENDS DE ARMAZENAMENTO ---
+# O app só conversa com a interface abaixo: `version` informa a versão atual dos
+# dados, `load` devolve o DataFrame largo (uma linha por faixa, colunas de
+# TRACK_COLUMNS e uma rating_<usuário> por usuário) e `save` grava a diferença
+# entre o DataFrame lido e o editado, devolvendo o DataFrame gravado e a nova
+# versão.
+
+
+class StorageBackend:
+    """Interface comum de leitura e gravação da biblioteca."""
+
+    def version(self):
+        """Retorna a versão atual dos dados, ou None se ela não puder ser consultada."""
+        raise NotImplementedError
+
+    def load(self, version):
+        """Carrega a biblioteca correspondente à versão informada."""
+        raise NotImplementedError
+
+    def save(self, original, updated):
+        """Grava as diferenças entre `original` e `updated` e retorna (DataFrame gravado, nova versão)."""
+        raise NotImplementedError
+
+
+class GSheetsBackend(StorageBackend):
+    """Biblioteca guardada na aba "Musicas" do Google Sheets, com réplica local em disco."""
+
+    def __init__(self, conn, worksheet=WORKSHEET):
+        self.conn = conn
+        self.worksheet = worksheet
+
+    def version(self):
+        return sheet_version(self.conn, self.worksheet)
+
+    def load(self, version):
+        return load_library(self.conn, version, self.worksheet)
+
+    def save(self, original, updated):
+        saved = prepare_dataframe(save_changes(self.conn, original, updated, self.worksheet))
+        return saved, record_write(self.conn, saved, self.worksheet)
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER NOT NULL);
+INSERT OR IGNORE INTO meta (key, value) VALUES ('version', 0);
+
+CREATE TABLE IF NOT EXISTS albums (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    artists TEXT,
+    year INTEGER
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    album_id INTEGER REFERENCES albums(id),
+    track_number INTEGER,
+    title TEXT,
+    composers TEXT
+);
+CREATE TABLE IF NOT EXISTS ratings (
+    track_id INTEGER NOT NULL REFERENCES tracks(id) ON DELETE CASCADE,
+    user TEXT NOT NULL,
+    rating REAL NOT NULL,
+    PRIMARY KEY (track_id, user)
+);
+
+CREATE INDEX IF NOT EXISTS idx_albums_key ON albums (title, artists, year);
+CREATE INDEX IF NOT EXISTS idx_tracks_album ON tracks (album_id, track_number);
+CREATE INDEX IF NOT EXISTS idx_ratings_user ON ratings (user, track_id);
+
+-- Tabelas de ligação por nome de versões anteriores, que nada lia
+DROP TABLE IF EXISTS track_composers;
+DROP TABLE IF EXISTS album_artists;
+DROP TABLE IF EXISTS artists;
+"""
+
+
+def _sql_value(value):
+    """Converte um valor do DataFrame para um tipo aceito pelo sqlite3."""
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, np.integer):
+        return int(value)
+    if isinstance(value, np.floating):
+        return float(value)
+    return value
+
+
+def _identifier(name):
+    """Nome entre aspas duplas para usar como coluna no SQL."""
+    return '"' + name.replace('"', '""') + '"'
+
+
+class SQLiteBackend(StorageBackend):
+    """Biblioteca guardada em um arquivo SQLite local, em tabelas normalizadas.
+
+    Álbuns são identificados por (título, artistas, ano), como no agrupamento das
+    páginas de estatísticas. Artistas e compositores ficam no texto original
+    ('; '), como no formato largo; filtros por nome e estatísticas saem dos
+    índices do instantâneo compartilhado, não de consultas ao banco. O id da
+    faixa é o rótulo da linha no DataFrame. Um banco vazio é
+    preenchido com `replace_all` (o app copia a planilha na primeira execução).
+    """
+
+    def __init__(self, path):
+        self.path = str(path)
+        with closing(self._connect()) as db, db:
+            db.executescript(SCHEMA)
+
+    def _connect(self):
+        db = sqlite3.connect(self.path)
+        db.execute("PRAGMA foreign_keys = ON")
+        return db
+
+    def version(self):
+        with closing(self._connect()) as db:
+            return db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+
+    def is_empty(self):
+        """Indica se o banco ainda não tem nenhuma faixa."""
+        with closing(self._connect()) as db:
+            return db.execute("SELECT NOT EXISTS (SELECT 1 FROM tracks)").fetchone()[0] == 1
+
+    def users(self):
+        """Usuários com notas no banco, além dos de USERS."""
+        with closing(self._connect()) as db:
+            stored = [user for (user,) in db.execute("SELECT DISTINCT user FROM ratings ORDER BY user")]
+        return list(dict.fromkeys(USERS + stored))
+
+    def _select(self):
+        users = self.users()
+        ratings = ",\n".join(
+            f"MAX(CASE WHEN r.user = ? THEN r.rating END) AS {_identifier(f'rating_{u}')}" for u in users
+        )
+        sql = f"""
+            SELECT t.id, t.track_number AS trackNumber, t.title, a.artists, a.title AS album, a.year,
+                   t.composers, {ratings}
+            FROM tracks t
+            LEFT JOIN albums a ON a.id = t.album_id
+            LEFT JOIN ratings r ON r.track_id = t.id
+            GROUP BY t.id
+            ORDER BY t.id
+        """
+        with closing(self._connect()) as db:
+            df = pd.read_sql_query(sql, db, params=users, index_col='id')
+        count_io('sqlite_read', rows=len(df), cells=df.size)
+        df.index = df.index.astype('int64').rename(None)
+        return prepare_dataframe(df)
+
+    def load(self, version):
+        return self._select()
+
+    def _write_tracks(self, db, rows):
+        """Insere ou atualiza faixas, álbuns e notas das linhas informadas."""
+        rows = widen_floats(rows)
+        albums = {
+            (title, artists, year): album_id
+            for album_id, title, artists, year in db.execute("SELECT id, title, artists, year FROM albums")
+        }
+        keys = [tuple(_sql_value(v) for v in key) for key in rows[['album', 'artists', 'year']].itertuples(index=False)]
+        new_albums = list(dict.fromkeys(k for k in keys if k not in albums))
+        for key in new_albums:
+            albums[key] = db.execute("INSERT INTO albums (title, artists, year) VALUES (?, ?, ?)", key).lastrowid
+
+        track_ids = [(int(i),) for i in rows.index]
+        db.executemany(
+            """INSERT INTO tracks (id, album_id, track_number, title, composers) VALUES (?, ?, ?, ?, ?)
+               ON CONFLICT (id) DO UPDATE SET album_id = excluded.album_id, track_number = excluded.track_number,
+               title = excluded.title, composers = excluded.composers""",
+            [
+                (int(i), albums[key], _sql_value(r.trackNumber), _sql_value(r.title), _sql_value(r.composers))
+                for i, key, r in zip(rows.index, keys, rows.itertuples(index=False))
+            ],
+        )
+
+        db.executemany("DELETE FROM ratings WHERE track_id = ?", track_ids)
+        ratings = rows[rating_columns(rows)]
+        ratings.columns = rating_users(rows)
+        long = ratings.stack().dropna()
+        db.executemany(
+            "INSERT INTO ratings (track_id, user, rating) VALUES (?, ?, ?)",
+            [(int(i), u, float(v)) for (i, u), v in long.items()],
+        )
+
+    def save(self, original, updated):
+        columns = list(original.columns)
+        changed, added, removed = compute_changes(original, updated, columns)
+        with closing(self._connect()) as db, db:
+            db.executemany("DELETE FROM tracks WHERE id = ?", [(int(i),) for i in removed])
+            self._write_tracks(db, pd.concat([changed, added]))
+            db.execute("DELETE FROM albums WHERE id NOT IN (SELECT album_id FROM tracks WHERE album_id IS NOT NULL)")
+            db.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
+            version = db.execute("SELECT value FROM meta WHERE key = 'version'").fetchone()[0]
+        count_io('sqlite_write', rows=len(changed) + len(added) + len(removed))
+        return prepare_dataframe(updated[columns].sort_index()), version
+
+    def replace_all(self, df):
+        """Substitui todo o conteúdo do banco pelo DataFrame informado (ex.: importação da planilha)."""
+        with closing(self._connect()) as db, db:
+            db.execute("DELETE FROM tracks")
+            db.execute("DELETE FROM albums")
+            self._write_tracks(db, df[TRACK_COLUMNS + rating_columns(df)])
+            db.execute("UPDATE meta SET value = value + 1 WHERE key = 'version'")
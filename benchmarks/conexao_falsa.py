@@ -0,0 +1,126 @@
+import re
+import time
+import uuid
+from collections import Counter
+
+import pandas as pd
+import numpy as np
+
+from armazenamento import FIRST_DATA_ROW
+
+# --- CONEXÃO FALSA COM O GOOGLE SHEETS ---
+# Substitui `GSheetsConnection` nos benchmarks: guarda a aba em memória, simula a
+# latência de cada chamada à API e contabiliza chamadas e células enviadas. Expõe
+# apenas o que o app usa: read/update da conexão e, via `client._select_worksheet`,
+# a aba do gspread (batch_update, row_values, add_rows, row_count, id e a planilha com
+# batch_update e get_lastUpdateTime).
+
+A1_RANGE = re.compile(r"([A-Z]+)(\d+):([A-Z]+)(\d+)")
+
+
+def _column_number(letters):
+    number = 0
+    for letter in letters:
+        number = number * 26 + ord(letter) - 64
+    return number
+
+
+class FakeSpreadsheet:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def get_lastUpdateTime(self):
+        self.worksheet._call('version')
+        return f"{self.worksheet.token}-v{self.worksheet.version}"
+
+    def batch_update(self, body):
+        self.worksheet._call('delete')
+        for request in body['requests']:
+            span = request['deleteDimension']['range']
+            first = span['startIndex'] - (FIRST_DATA_ROW - 1)
+            last = span['endIndex'] - (FIRST_DATA_ROW - 1)
+            data = self.worksheet.data
+            self.worksheet.data = pd.concat([data.iloc[:first], data.iloc[last:]], ignore_index=True)
+        self.worksheet.version += 1
+
+
+class FakeWorksheet:
+    def __init__(self, data, latency):
+        self.data = data.reset_index(drop=True).astype(object)
+        self.latency = latency
+        self.version = 0
+        self.token = uuid.uuid4().hex  # distingue as versões de abas diferentes na réplica
+        self.id = 0
+        self.title = "Musicas"
+        self.spreadsheet = FakeSpreadsheet(self)
+        self.calls = Counter()
+        self.cells_written = 0
+        self._extra_rows = 0
+
+    def _call(self, name, cells=0):
+        self.calls[name] += 1
+        self.cells_written += cells
+        if self.latency:
+            time.sleep(self.latency)
+
+    @property
+    def row_count(self):
+        return len(self.data) + FIRST_DATA_ROW - 1 + self._extra_rows
+
+    def row_values(self, row):
+        self._call('row_values')
+        return [str(col) for col in self.data.columns] if row == 1 else self.data.iloc[row - FIRST_DATA_ROW].tolist()
+
+    def add_rows(self, rows):
+        self._call('add_rows')
+        self._extra_rows += rows
+
+    def batch_update(self, data, value_input_option=None):
+        cells = sum(len(row) for entry in data for row in entry['values'])
+        self._call('batch_update', cells)
+        for entry in data:
+            first_col, first_row, last_col, last_row = A1_RANGE.match(entry['range']).groups()
+            first = int(first_row) - FIRST_DATA_ROW
+            last = int(last_row) - FIRST_DATA_ROW
+            if last >= len(self.data):
+                grow = last + 1 - len(self.data)
+                empty = pd.DataFrame(np.full((grow, len(self.data.columns)), np.nan, dtype=object), columns=self.data.columns)
+                self.data = pd.concat([self.data, empty], ignore_index=True)
+                self._extra_rows = max(0, self._extra_rows - grow)
+            values = [[np.nan if v == "" else v for v in row] for row in entry['values']]
+            self.data.iloc[first:last + 1, _column_number(first_col) - 1:_column_number(last_col)] = values
+        self.version += 1
+
+
+class FakeClient:
+    def __init__(self, worksheet):
+        self.worksheet = worksheet
+
+    def _select_worksheet(self, worksheet=None, **kwargs):
+        return self.worksheet
+
+
+class FakeGSheetsConnection:
+    """Conexão em memória com a mesma interface usada pelo app, com latência configurável."""
+
+    def __init__(self, data, latency=0.0):
+        self.worksheet = FakeWorksheet(data, latency)
+        self.client = FakeClient(self.worksheet)
+
+    @property
+    def calls(self):
+        return self.worksheet.calls
+
+    def read(self, worksheet=None, usecols=None, ttl=None, **options):
+        self.worksheet._call('read')
+        data = self.worksheet.data
+        if usecols is not None:
+            data = data.iloc[:, usecols]
+        return data.infer_objects()
+
+    def update(self, worksheet=None, data=None, **kwargs):
+        self.worksheet._call('update', data.size)
+        self.worksheet.data = data.reset_index(drop=True).astype(object)
+        self.worksheet._extra_rows = 0
+        self.worksheet.version += 1
+        return data
@@ -0,0 +1,66 @@
+import pandas as pd
+import numpy as np
+
+from armazenamento import COLUMNS, USERS
+
+# --- GERADOR DE BIBLIOTECAS SINTÉTICAS ---
+# Produz DataFrames no formato da aba "Musicas": álbuns de 6 a 18 faixas, com um
+# a três artistas por álbum e um a três compositores por faixa, e notas esparsas
+# (cada usuário começou só parte dos álbuns e avaliou parte das faixas deles).
+
+SYLLABLES = ["ma", "ri", "jo", "ão", "se", "bas", "ti", "ca", "e", "tano", "gil", "ber", "to", "lu", "iz", "chi", "co"]
+
+
+def _names(rng, count, prefix):
+    """Gera `count` nomes distintos combinando sílabas."""
+    parts = rng.choice(SYLLABLES, size=(count, 4))
+    return [f"{prefix}{''.join(p[:2]).title()} {''.join(p[2:]).title()} {i}" for i, p in enumerate(parts)]
+
+
+def _join(rng, pool, groups, max_size):
+    """Sorteia de 1 a `max_size` nomes distintos do `pool` para cada grupo e junta com '; '."""
+    sizes = rng.choice(np.arange(1, max_size + 1), size=groups, p=[0.75, 0.18, 0.07][:max_size])
+    picks = rng.integers(0, len(pool), size=(groups, max_size))
+    # Sem repetição no grupo: sorteia de novo cada nome igual a um anterior da mesma linha
+    for col in range(1, max_size):
+        repeated = (picks[:, [col]] == picks[:, :col]).any(axis=1)
+        while repeated.any():
+            picks[repeated, col] = rng.integers(0, len(pool), size=repeated.sum())
+            repeated = (picks[:, [col]] == picks[:, :col]).any(axis=1)
+    pool = np.asarray(pool, dtype=object)
+    return ['; '.join(pool[row[:size]]) for row, size in zip(picks, sizes)]
+
+
+def generate_library(n_tracks, seed=0, rated_album_share=0.3, rated_track_share=0.7):
+    """Gera uma biblioteca sintética com aproximadamente `n_tracks` faixas."""
+    rng = np.random.default_rng(seed)
+    sizes = rng.integers(6, 19, size=n_tracks // 6 + 1)
+    sizes = sizes[:np.searchsorted(np.cumsum(sizes), n_tracks) + 1]
+    sizes[-1] -= sizes.sum() - n_tracks
+    n_albums = len(sizes)
+
+    artists = _names(rng, max(10, n_albums // 3), "")
+    composers = _names(rng, max(10, n_tracks // 40), "C. ")
+
+    album_artists = np.asarray(_join(rng, artists, n_albums, 3), dtype=object)
+    album_titles = np.asarray([f"Álbum {i} {t}" for i, t in enumerate(_names(rng, n_albums, ""))], dtype=object)
+    album_years = rng.integers(1950, 2025, size=n_albums)
+
+    album_of_track = np.repeat(np.arange(n_albums), sizes)
+    starts = np.repeat(np.cumsum(sizes) - sizes, sizes)
+    track_numbers = np.arange(n_tracks) - starts + 1
+
+    df = pd.DataFrame({
+        'trackNumber': track_numbers,
+        'title': [f"Faixa {n} {w}" for n, w in zip(track_numbers, rng.choice(SYLLABLES, n_tracks))],
+        'artists': album_artists[album_of_track],
+        'album': album_titles[album_of_track],
+        'year': album_years[album_of_track],
+        'composers': _join(rng, composers, n_tracks, 3),
+    })
+    for u in USERS:
+        started = rng.random(n_albums) < rated_album_share
+        rated = started[album_of_track] & (rng.random(n_tracks) < rated_track_share)
+        scores = np.clip(np.round(rng.normal(7, 1.5, n_tracks) * 2) / 2, 0, 10)
+        df[f"rating_{u}"] = np.where(rated, scores, np.nan)
+    return df[COLUMNS]
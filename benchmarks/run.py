@@ -0,0 +1,231 @@
+"""Benchmarks do app com bibliotecas sintéticas.
+
+Uso (a partir da raiz do repositório):
+
+    python -m benchmarks.run --sizes 10000 100000 1000000 --output resultados.json
+
+Cada cenário é medido para cada tamanho de biblioteca e o resultado é emitido em
+JSON (tempo mínimo e mediano das repetições, mais informações do cenário), para
+comparar execuções ao longo do tempo.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+# A réplica local dos benchmarks não deve sobrescrever a do app
+os.environ.setdefault("MUSIC_TRACKER_REPLICA_DIR", tempfile.mkdtemp(prefix="replica-bench-"))
+
+import pandas as pd
+import numpy as np
+
+from armazenamento import prepare_dataframe, save_changes, with_new_rows
+from backends import GSheetsBackend, SQLiteBackend
+from compartilhado import SharedLibrary
+from indices import AlbumIndex, AlbumStats, Membership, RatingsMatrix, SearchIndex, Vocabulary
+from replica import read_replica, store_replica
+from benchmarks.conexao_falsa import FakeGSheetsConnection
+from benchmarks.gerador import generate_library
+
+APP_PATH = Path(__file__).resolve().parent.parent / "inicio.py"
+PAGES = ["📚 Minha Biblioteca", "➕ Adicionar Dados", "🎧 Próximos a Ouvir", "🏆 Álbuns Concluídos", "👥 Comparar Notas"]
+
+
+def timed(fn, repeat):
+    """Executa `fn` `repeat` vezes e retorna (tempos em segundos, último resultado)."""
+    times, result = [], None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return times, result
+
+
+def record(results, scenario, size, times, **extra):
+    entry = {
+        'scenario': scenario,
+        'size': size,
+        'min_s': min(times),
+        'median_s': statistics.median(times),
+        'repeat': len(times),
+        **extra,
+    }
+    results.append(entry)
+    print(f"{scenario:<28} {size:>9} {entry['median_s'] * 1000:>10.1f} ms", file=sys.stderr)
+
+
+def bench_data(results, size, raw, repeat):
+    """Carga, réplica e estruturas derivadas."""
+    conn = FakeGSheetsConnection(raw)
+    read = lambda: conn.read(worksheet="Musicas")
+    times, df = timed(lambda: prepare_dataframe(read()), repeat)
+    # Memória do DataFrame com os tipos compactos e com os tipos originais da leitura
+    plain = prepare_dataframe(read(), compact=False)
+    record(results, 'load_and_coerce', size, times,
+           memory_bytes=int(df.memory_usage(deep=True).sum()),
+           uncompacted_memory_bytes=int(plain.memory_usage(deep=True).sum()))
+
+    with tempfile.TemporaryDirectory() as directory:
+        directory = Path(directory)
+        times, _ = timed(lambda: store_replica(df, "v0", directory=directory), repeat)
+        record(results, 'replica_store', size, times)
+        times, _ = timed(lambda: read_replica(directory=directory), repeat)
+        record(results, 'replica_load', size, times)
+
+    times, vocab = timed(lambda: Vocabulary(df), repeat)
+    record(results, 'vocabulary_build', size, times, artists=len(vocab.artists), composers=len(vocab.composers))
+
+    times, artist_index = timed(lambda: Membership(df['artists']), repeat)
+    record(results, 'artist_index_build', size, times)
+    selected = vocab.artists[:3]
+    times, mask = timed(lambda: df[artist_index.mask(selected)], max(repeat, 5))
+    record(results, 'artist_filter', size, times, matches=len(mask))
+
+    times, album_index = timed(lambda: AlbumIndex(df), repeat)
+    record(results, 'album_index_build', size, times, albums=len(album_index.table))
+    first = df.iloc[0]
+    times, album = timed(lambda: df.iloc[album_index.positions(first['album'], first['artists'])], max(repeat, 5))
+    record(results, 'album_lookup', size, times, tracks=len(album))
+
+    times, stats = timed(lambda: AlbumStats(df), repeat)
+    record(results, 'album_stats_build', size, times, albums=len(stats.table))
+    times, _ = timed(lambda: stats.for_user('jom'), max(repeat, 5))
+    record(results, 'album_stats_for_user', size, times)
+
+    # As estatísticas entre usuários são guardadas na matriz: cada repetição usa uma matriz nova
+    times, ratings = timed(lambda: RatingsMatrix(df, stats), repeat)
+    record(results, 'ratings_matrix_build', size, times, users=len(ratings.users))
+    times, _ = timed(lambda: RatingsMatrix(df, stats).agreement, repeat)
+    record(results, 'ratings_agreement', size, times)
+    times, rankings = timed(lambda: RatingsMatrix(df, stats).album_rankings, repeat)
+    record(results, 'ratings_album_rankings', size, times, albums=len(rankings))
+
+    times, search_index = timed(lambda: SearchIndex(df), repeat)
+    record(results, 'search_index_build', size, times)
+    query = str(df['title'].iloc[0]).split()[0]
+    times, positions = timed(lambda: search_index.search(query), max(repeat, 5))
+    record(results, 'search_query', size, times, query=query, matches=len(positions))
+    return df
+
+
+def _edited_album(df):
+    """Retorna uma cópia do DataFrame com a nota de uma faixa do primeiro álbum alterada."""
+    updated = df.copy()
+    label = df.index[0]
+    current = updated.loc[label, 'rating_jom']
+    updated.loc[label, 'rating_jom'] = 5.0 if current != 5.0 else 6.0
+    return updated
+
+
+def _new_album_rows(size=12):
+    return [{
+        'trackNumber': i + 1, 'title': f"Nova Faixa {i + 1}", 'artists': "Artista Novo", 'album': "Álbum Novo",
+        'year': 2024, 'composers': "Compositor Novo", 'rating_jom': np.nan, 'rating_jov': np.nan, 'rating_job': np.nan,
+    } for i in range(size)]
+
+
+def bench_saves(results, size, raw, df, latency):
+    """Caminhos de gravação: edição de álbum, álbum inteiro e música avulsa."""
+    scenarios = {
+        'save_edit_album': _edited_album,
+        'save_add_album': lambda frame: with_new_rows(frame, _new_album_rows()),
+        'save_add_song': lambda frame: with_new_rows(frame, _new_album_rows(1)),
+    }
+    for name, make_updated in scenarios.items():
+        conn = FakeGSheetsConnection(raw, latency=latency)
+        updated = make_updated(df)
+        times, _ = timed(lambda: save_changes(conn, df, updated), 1)
+        record(results, f"{name}_sheets", size, times,
+               api_calls=dict(conn.calls), cells_written=conn.worksheet.cells_written)
+
+    # Com a fila de gravação, a sessão só espera a publicação; a gravação segue em segundo plano
+    conn = FakeGSheetsConnection(raw, latency=latency)
+    library = SharedLibrary(GSheetsBackend(conn))
+    snapshot = library.current(library.backend.version())
+    updated = _edited_album(snapshot.df)
+    # Como na edição de álbum do app, só as linhas do álbum editado são comparadas
+    first = snapshot.df.iloc[0]
+    rows = snapshot.df.index[snapshot.album_index.positions(first['album'], first['artists'])]
+    times, _ = timed(lambda: library.save(snapshot, updated, rows=rows), 1)
+    write_times, _ = timed(lambda: library.writer.wait_idle(), 1)
+    record(results, 'save_edit_album_queued', size, times, background_write_s=write_times[0], api_calls=dict(conn.calls))
+
+    with tempfile.TemporaryDirectory() as directory:
+        backend = SQLiteBackend(Path(directory) / "bench.db")
+        times, _ = timed(lambda: backend.replace_all(df), 1)
+        record(results, 'sqlite_import', size, times)
+        times, loaded = timed(lambda: backend.load(backend.version()), 1)
+        record(results, 'sqlite_load', size, times)
+        for name, make_updated in scenarios.items():
+            updated = make_updated(loaded)
+            times, _ = timed(lambda: backend.save(loaded, updated), 1)
+            record(results, f"{name}_sqlite", size, times)
+            loaded = backend.load(backend.version())
+
+
+def bench_pages(results, size, raw, latency):
+    """Renderização de cada página pelo AppTest do Streamlit, com a conexão falsa."""
+    import streamlit as st
+    from streamlit.testing.v1 import AppTest
+
+    conn = FakeGSheetsConnection(raw, latency=latency)
+    st.cache_data.clear()
+    st.cache_resource.clear()
+    original_connection = st.connection
+    st.connection = lambda *args, **kwargs: conn
+    try:
+        at = AppTest.from_file(str(APP_PATH), default_timeout=600)
+        at.session_state['user'] = 'jom'
+        times, _ = timed(at.run, 1)
+        record(results, 'page_cold_start', size, times, api_calls=dict(conn.calls))
+        for page in PAGES:
+            at.sidebar.radio[0].set_value(page)
+            times, _ = timed(at.run, 1)
+            record(results, f"page_render[{page}]", size, times, errors=[str(e.value) for e in at.exception])
+    finally:
+        st.connection = original_connection
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--repeat", type=int, default=3, help="Repetições de cada cenário de dados")
+    parser.add_argument("--latency", type=float, default=0.0, help="Latência simulada por chamada à API (s)")
+    parser.add_argument("--apptest-max-size", type=int, default=100_000,
+                        help="Maior biblioteca renderizada pelo AppTest (0 desativa)")
+    parser.add_argument("--output", help="Arquivo JSON de saída (padrão: stdout)")
+    args = parser.parse_args(argv)
+
+    results = []
+    for size in args.sizes:
+        raw = generate_library(size)
+        df = bench_data(results, size, raw, args.repeat)
+        bench_saves(results, size, raw, df, args.latency)
+        if size <= args.apptest_max_size:
+            bench_pages(results, size, raw, args.latency)
+
+    report = {
+        'meta': {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+            'python': platform.python_version(),
+            'pandas': pd.__version__,
+            'numpy': np.__version__,
+            'latency_s': args.latency,
+            'sizes': args.sizes,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        Path(args.output).write_text(output)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+import threading
+import time
+
+import pandas as pd
+
+from armazenamento import compute_changes, prepare_dataframe
+from fila_gravacao import Batch, Edit, WriteBehindQueue
+from indices import AlbumIndex, AlbumStats, Membership, RatingsMatrix, SearchIndex, Vocabulary
+from instrumentacao import span
+
+# --- BIBLIOTECA COMPARTILHADA ENTRE AS SESSÕES ---
+# O processo do servidor guarda um único instantâneo da biblioteca (DataFrame e
+# índices derivados), usado somente para leitura por todas as sessões. Cada
+# gravação publica na hora um novo instantâneo com número de versão maior, já
+# com a alteração, e a entrega à fila de gravação em segundo plano; as outras
+# sessões passam a usá-lo na próxima execução, sem reler o armazenamento.
+
+# Sem versão do armazenamento disponível, o instantâneo é relido após este tempo
+UNVERSIONED_TTL_S = 30
+
+
+class Snapshot:
+    """Versão imutável da biblioteca: DataFrame, vocabulário, índices de nomes e de álbuns e estatísticas de álbuns.
+
+    O índice de busca e a matriz de notas são montados na primeira consulta.
+    """
+
+    def __init__(self, number, data_version, df, vocab, artist_index, composer_index, album_index, album_stats,
+                 search_index=None, ratings=None):
+        self.number = number
+        self.data_version = data_version
+        self.df = df
+        self.vocab = vocab
+        self.artist_index = artist_index
+        self.composer_index = composer_index
+        self.album_index = album_index
+        self.album_stats = album_stats
+        self.created_at = time.monotonic()
+        self._search_index = search_index
+        self._ratings = ratings
+        self._lazy_lock = threading.Lock()
+
+    @property
+    def search_index(self):
+        """Índice de busca textual, montado na primeira busca feita a partir deste instantâneo."""
+        with self._lazy_lock:
+            if self._search_index is None:
+                with span("índice de busca"):
+                    self._search_index = SearchIndex(self.df)
+            return self._search_index
+
+    @property
+    def ratings(self):
+        """Matriz de notas de todos os usuários; guarda as estatísticas entre usuários desta versão."""
+        with self._lazy_lock:
+            if self._ratings is None:
+                with span("matriz de notas"):
+                    self._ratings = RatingsMatrix(self.df, self.album_stats)
+            return self._ratings
+
+
+class SharedLibrary:
+    """Instantâneo da biblioteca compartilhado pelas sessões do processo.
+
+    As sessões guardam só a referência ao instantâneo que estão usando. Os
+    índices de um instantâneo publicado nunca são alterados: a gravação monta
+    cópias atualizadas para o instantâneo seguinte.
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self.writer = WriteBehindQueue(self)
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._last_number = 0
+        self._known_versions = set()  # versões lidas ou gravadas por este processo
+
+    def _next_number(self):
+        self._last_number += 1
+        return self._last_number
+
+    def _build(self, df, data_version):
+        return Snapshot(
+            self._next_number(), data_version, df, Vocabulary(df),
+            Membership(df['artists']), Membership(df['composers']), AlbumIndex(df), AlbumStats(df),
+        )
+
+    def _is_current(self, data_version):
+        snapshot = self._snapshot
+        if snapshot is None:
+            return False
+        # Com gravações na fila, é ela quem reconcilia o instantâneo com o armazenamento
+        if self.writer.busy or data_version in self._known_versions:
+            return True
+        if data_version is None:
+            return time.monotonic() - snapshot.created_at < UNVERSIONED_TTL_S
+        return False
+
+    def current(self, data_version):
+        """Retorna o instantâneo atual, carregando-o do armazenamento só se a versão mudou por fora."""
+        if self._is_current(data_version):
+            return self._snapshot
+        with self._lock:
+            # Outra sessão pode ter carregado a mesma versão enquanto esta esperava
+            if not self._is_current(data_version):
+                with span("carga"):
+                    df = self.backend.load(data_version)
+                with span("índices"):
+                    self._snapshot = self._build(df, data_version)
+                self.writer.set_base(df, data_version)
+                if data_version is not None:
+                    self._known_versions.add(data_version)
+            return self._snapshot
+
+    def save(self, base, updated, user=None, rows=None):
+        """Publica `updated` (editado a partir de `base`) e enfileira a gravação; retorna o id da alteração.
+
+        Com `rows` (rótulos das únicas linhas que a edição pode ter alterado, sem
+        linhas novas ou removidas), só essas linhas são comparadas. `updated` deve
+        vir de `set_cells`/`with_new_rows`, que mantêm os tipos compactos, e passa
+        a ser o DataFrame do instantâneo: não deve ser alterado depois.
+        """
+        if rows is None:
+            changed, added, removed = compute_changes(base.df, updated, list(base.df.columns))
+        else:
+            changed, added, removed = compute_changes(base.df.loc[rows], updated.loc[rows], list(base.df.columns))
+        edit = Edit.from_changes(base.df, changed, added, removed, user)
+        old_rows = base.df.loc[changed.index.union(removed)]
+        new_rows = prepare_dataframe(pd.concat([changed, added]))
+        self.publish(base, updated, old_rows, new_rows, edit)
+        return self.writer.submit(edit)
+
+    def publish(self, base, df, old_rows, new_rows, edit):
+        """Publica `df` (derivado de `base` pela `edit`) como novo instantâneo e o retorna.
+
+        Se `base` ainda é o instantâneo atual, os índices são atualizados só com
+        as linhas alteradas. Senão (outra sessão publicou no meio), `df` não tem
+        as alterações dela: a edição é reaplicada sobre o instantâneo atual e os
+        índices são refeitos.
+        """
+        with self._lock:
+            if base is not self._snapshot:
+                current = self._snapshot
+                df = Batch([edit]).apply(current.df, check=False)[0]
+                self._snapshot = self._build(df, current.data_version)
+                return self._snapshot
+            vocab = base.vocab.copy()
+            vocab.apply_changes(old_rows, new_rows)
+            album_stats = base.album_stats.copy()
+            album_stats.apply_changes(old_rows, new_rows)
+            artist_index = base.artist_index.copy()
+            artist_index.refresh(df['artists'])
+            composer_index = base.composer_index.copy()
+            composer_index.refresh(df['composers'])
+            album_index = base.album_index.copy()
+            album_index.apply_changes(df, old_rows, new_rows)
+            search_index = None
+            if base._search_index is not None:  # sem busca feita, o índice continua sob demanda
+                search_index = base._search_index.copy()
+                search_index.refresh(df)
+            self._snapshot = Snapshot(
+                self._next_number(), base.data_version, df, vocab, artist_index, composer_index, album_index,
+                album_stats, search_index,
+            )
+            return self._snapshot
+
+    def confirm(self, data_version):
+        """Registra que o instantâneo publicado foi gravado e corresponde à versão informada."""
+        with self._lock:
+            if data_version is not None:
+                self._known_versions.add(data_version)
+            s = self._snapshot
+            self._snapshot = Snapshot(
+                self._next_number(), data_version, s.df, s.vocab, s.artist_index, s.composer_index, s.album_index,
+                s.album_stats, s._search_index, s._ratings,
+            )
+
+    def reset(self, df, data_version):
+        """Substitui o instantâneo por `df`, refazendo os índices (após conflito ou mudança externa)."""
+        with self._lock:
+            if data_version is not None:
+                self._known_versions.add(data_version)
+            self._snapshot = self._build(df, data_version)
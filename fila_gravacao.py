@@ -0,0 +1,341 @@
+import atexit
+import itertools
+import logging
+import threading
+import time
+from collections import defaultdict
+
+import pandas as pd
+import numpy as np
+
+from armazenamento import changed_cells, set_cells, with_new_rows
+from instrumentacao import profiling_active, span, start_run
+
+# --- FILA DE GRAVAÇÃO EM SEGUNDO PLANO ---
+# Cada gravação de uma sessão vira uma `Edit` (células alteradas com o valor que
+# a sessão via antes, linhas novas e linhas removidas). A interface publica a
+# alteração na hora e a entrega à fila; uma thread junta as alterações que
+# chegam em sequência em um único lote, confere a versão do armazenamento e
+# grava. Se o armazenamento mudou por fora, o lote é reaplicado sobre o
+# conteúdo atual: cada linha editada é procurada pela sua identidade (álbum,
+# artistas, número e título), já que linhas removidas, inseridas ou reordenadas
+# na aba mudam os rótulos; células cuja faixa não é mais encontrada, ou que outra
+# pessoa alterou desde então, são rejeitadas em vez de sobrescritas. A thread
+# não herda o perfil de desempenho das sessões: cada lote com alguma alteração
+# feita com o diagnóstico ligado ganha o seu próprio perfil, gravado no log e
+# guardado nas alterações para o painel da sessão.
+
+COALESCE_WINDOW_S = 0.5  # espera por mais alterações antes de gravar o lote
+MAX_ATTEMPTS = 5
+BACKOFF_S = 1.0  # espera antes da 2ª tentativa; dobra a cada nova falha
+SHUTDOWN_WAIT_S = 30  # espera máxima pela fila ao encerrar o processo
+
+IDENTITY = ['album', 'artists', 'trackNumber', 'title']  # identifica a faixa independentemente da linha
+
+logger = logging.getLogger(__name__)
+
+
+def _same_value(a, b):
+    """Compara dois valores de célula, tratando nulos como iguais entre si."""
+    a_missing, b_missing = pd.isna(a), pd.isna(b)
+    if a_missing or b_missing:
+        return a_missing and b_missing
+    return bool(a == b)
+
+
+def _identity_value(value):
+    if value is None or (not isinstance(value, str) and pd.isna(value)):
+        return None
+    if isinstance(value, (int, float, np.number)):
+        return float(value)  # 3 (Int16) e 3.0 (float) são o mesmo número de faixa
+    return value
+
+
+def _identities(df, labels):
+    """Identidade (álbum, artistas, nº da faixa, título) de cada rótulo de `labels` em `df`."""
+    rows = df.loc[list(labels), IDENTITY].astype(object)
+    return {
+        label: tuple(_identity_value(v) for v in values)
+        for label, values in zip(rows.index, rows.itertuples(index=False, name=None))
+    }
+
+
+class Edit:
+    """Alteração enviada por uma sessão e o resultado da sua gravação.
+
+    `cells` associa (rótulo, coluna) a (valor antes da edição, valor novo);
+    `identity` guarda a identidade, antes da edição, das linhas alteradas ou
+    removidas; `status` é 'pending', 'saved', 'conflict' (parte das células
+    rejeitada) ou 'failed'. `profile` é o registro de desempenho do lote em que
+    a alteração foi gravada, se ele foi medido.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, cells, added, removed, user=None, identity=None):
+        self.id = next(Edit._ids)
+        self.cells = cells
+        self.added = added
+        self.removed = set(removed)
+        self.user = user
+        self.identity = identity or {}
+        self.profiled = False
+        self.profile = None
+        self.status = 'pending'
+        self.rejected = []
+        self.error = None
+
+    @classmethod
+    def from_changes(cls, original, changed, added, removed, user=None):
+        """Monta a alteração a partir do resultado de `compute_changes` sobre `original`."""
+        before = original.loc[changed.index, changed.columns]
+        rows, cols = np.nonzero(changed_cells(before, changed))
+        cells = {
+            (changed.index[r], changed.columns[c]): (before.iat[r, c], changed.iat[r, c])
+            for r, c in zip(rows, cols)
+        }
+        identity = _identities(original, dict.fromkeys([label for label, _ in cells] + list(removed)))
+        return cls(cells, added, removed, user, identity)
+
+
+class Batch:
+    """Alterações consecutivas combinadas; o último valor de cada célula prevalece."""
+
+    def __init__(self, edits):
+        self.edits = edits
+        self.cells = {}
+        self.removed = set()
+        self.identity = {}
+        added = [edit.added for edit in edits if len(edit.added)]
+        self.added = pd.concat(added) if added else None
+        for edit in edits:
+            for label, identity in edit.identity.items():
+                self.identity.setdefault(label, identity)  # a da primeira edição é a de antes do lote
+            for (label, col), (base, new) in edit.cells.items():
+                if self.added is not None and label in self.added.index:
+                    set_cells(self.added, [label], col, [new])  # linha ainda não gravada
+                elif (label, col) in self.cells:
+                    self.cells[label, col] = (self.cells[label, col][0], new)
+                else:
+                    self.cells[label, col] = (base, new)
+            for label in edit.removed:
+                if self.added is not None and label in self.added.index:
+                    self.added = self.added.drop(index=label)
+                else:
+                    self.removed.add(label)
+        self.cells = {key: value for key, value in self.cells.items() if key[0] not in self.removed}
+
+    def _locate(self, stored):
+        """Rótulo em `stored` de cada linha editada, encontrada pela identidade; None se não há uma só.
+
+        Em geral a linha continua no mesmo rótulo; só quando não está lá a
+        identidade de todas as linhas de `stored` é calculada para procurá-la.
+        """
+        labels = {}
+        present = [label for label in self.identity if label in stored.index]
+        current = _identities(stored, present) if present else {}
+        by_identity = None
+        for label, identity in self.identity.items():
+            if current.get(label) == identity:
+                labels[label] = label
+                continue
+            if by_identity is None:
+                by_identity = defaultdict(list)
+                for other, other_identity in _identities(stored, stored.index).items():
+                    by_identity[other_identity].append(other)
+            found = by_identity.get(identity, [])
+            labels[label] = found[0] if len(found) == 1 else None
+        return labels
+
+    def apply(self, stored, check=True):
+        """Aplica o lote sobre `stored` e retorna (DataFrame, células rejeitadas, rótulos mudaram).
+
+        Cada linha é procurada em `stored` pela identidade; células de linhas não
+        encontradas são rejeitadas. Com `check`, uma célula só é gravada se em
+        `stored` ela ainda tem o valor que a sessão via (ou já tem o valor novo);
+        senão é rejeitada.
+        """
+        updated = stored.copy()
+        rejected = []
+        located = self._locate(stored)
+        by_column = defaultdict(lambda: ([], []))
+        for (key_label, col), (base, new) in self.cells.items():
+            label = located.get(key_label, key_label)
+            if label is None or label not in stored.index:
+                rejected.append((key_label, col))
+                continue
+            current = stored.at[label, col]
+            if check and not (_same_value(current, base) or _same_value(current, new)):
+                rejected.append((key_label, col))
+                continue
+            by_column[col][0].append(label)
+            by_column[col][1].append(new)
+        for col, (labels, values) in by_column.items():
+            set_cells(updated, labels, col, values)
+
+        relabeled = bool(self.removed) or any(label != key for key, label in located.items())
+        if self.added is not None and len(self.added):
+            updated = with_new_rows(updated, self.added.to_dict('records'))
+            relabeled = relabeled or not updated.index[-len(self.added):].equals(self.added.index)
+        if self.removed:
+            removed = [located.get(label, label) for label in self.removed]
+            updated = updated.drop(index=[label for label in removed if label is not None and label in updated.index])
+        return updated, rejected, relabeled
+
+
+class WriteBehindQueue:
+    """Fila de gravação da biblioteca compartilhada, atendida por uma thread em segundo plano.
+
+    `stored` e `version` são o conteúdo e a versão do armazenamento conhecidos
+    pela fila; depois de cada gravação a biblioteca é confirmada (mesmos dados,
+    nova versão) ou, se o resultado difere do que foi publicado, reconstruída
+    a partir do que foi gravado mais as alterações ainda na fila.
+    """
+
+    def __init__(self, library):
+        self.library = library
+        self.stored = None
+        self.version = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._idle = threading.Event()
+        self._idle.set()
+        self._pending = []
+        self._edits = {}
+        self._thread = None
+        # A thread é daemon: sem isto, o que ainda está na fila some quando o processo termina
+        atexit.register(self.flush)
+
+    def set_base(self, stored, version):
+        """Define o conteúdo do armazenamento a partir do qual as próximas alterações serão gravadas."""
+        with self._lock:
+            self.stored, self.version = stored, version
+
+    @property
+    def busy(self):
+        """Indica se há alterações na fila ou sendo gravadas."""
+        return not self._idle.is_set()
+
+    def submit(self, edit):
+        """Enfileira uma alteração e retorna o seu id."""
+        edit.profiled = profiling_active()
+        with self._lock:
+            self._pending.append(edit)
+            self._edits[edit.id] = edit
+            self._idle.clear()
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name="fila-gravacao", daemon=True)
+                self._thread.start()
+        self._wakeup.set()
+        return edit.id
+
+    def take(self, edit_id):
+        """Retorna a alteração; as já concluídas são retiradas do registro."""
+        with self._lock:
+            edit = self._edits.get(edit_id)
+            if edit is not None and edit.status != 'pending':
+                del self._edits[edit_id]
+            return edit
+
+    def wait_idle(self, timeout=None):
+        """Espera a fila esvaziar; retorna False se o tempo acabar antes."""
+        return self._idle.wait(timeout)
+
+    def flush(self, timeout=SHUTDOWN_WAIT_S):
+        """Espera a fila gravar o que falta; registra no log as alterações que continuarem sem gravar."""
+        if self.wait_idle(timeout):
+            return True
+        with self._lock:
+            lost = [edit for edit in self._edits.values() if edit.status == 'pending']
+        for edit in lost:
+            logger.error(
+                "Alteração %s (usuário %s) não gravada: %d célula(s), %d linha(s) nova(s), %d removida(s)",
+                edit.id, edit.user, len(edit.cells), len(edit.added), len(edit.removed),
+            )
+        return False
+
+    def _run(self):
+        while True:
+            self._wakeup.wait()
+            time.sleep(COALESCE_WINDOW_S)
+            with self._lock:
+                self._wakeup.clear()
+                edits, self._pending = self._pending, []
+            if edits:
+                try:
+                    self._commit(edits)
+                except Exception as e:  # erro fora da gravação em si; a thread continua atendendo a fila
+                    for edit in edits:
+                        edit.status, edit.error = 'failed', str(e)
+            with self._lock:
+                if not self._pending:
+                    self._idle.set()
+
+    def _try_commit(self, batch):
+        """Confere a versão do armazenamento, reaplica o lote se preciso e grava."""
+        backend = self.library.backend
+        version = backend.version()
+        reloaded = version is not None and version != self.version
+        if reloaded:
+            # O armazenamento mudou por fora desde a última leitura ou gravação
+            self.set_base(backend.load(version), version)
+        updated, rejected, relabeled = batch.apply(self.stored)
+        if len(rejected) == len(batch.cells) and batch.added is None and not batch.removed:
+            return rejected, bool(rejected) or reloaded  # nada a gravar
+        saved, saved_version = backend.save(self.stored, updated)
+        self.set_base(saved, saved_version)
+        resync = reloaded or relabeled or bool(rejected) or not saved.index.equals(updated.index)
+        return rejected, resync
+
+    def _commit(self, edits):
+        users = sorted({str(edit.user) for edit in edits if edit.user is not None})
+        profiler = start_run(any(edit.profiled for edit in edits), ", ".join(users) or None)
+        record = None
+        if profiler is not None:
+            profiler.page = "fila de gravação"
+        try:
+            with span("gravação em segundo plano"):
+                outcomes = self._commit_batch(edits)
+        finally:
+            if profiler is not None:
+                record = profiler.finish()
+                start_run(False)
+        # O status muda por último: quem vê a alteração concluída já encontra o perfil do lote
+        for edit, (status, rejected, error) in zip(edits, outcomes):
+            edit.profile = record
+            edit.rejected, edit.error, edit.status = rejected, error, status
+
+    def _commit_batch(self, edits):
+        """Grava o lote e retorna, para cada alteração, (status, células rejeitadas, erro)."""
+        batch = Batch(edits)
+        error = None
+        for attempt in range(MAX_ATTEMPTS):
+            try:
+                rejected, resync = self._try_commit(batch)
+                break
+            except Exception as e:
+                error = e
+                if attempt + 1 < MAX_ATTEMPTS:
+                    time.sleep(BACKOFF_S * 2 ** attempt)
+        else:
+            self._resync()  # descarta da biblioteca publicada as alterações que não foram gravadas
+            return [('failed', [], str(error))] * len(edits)
+
+        rejected = set(rejected)
+        outcomes = []
+        for edit in edits:
+            edit_rejected = [key for key in edit.cells if key in rejected]
+            outcomes.append(('conflict' if edit_rejected else 'saved', edit_rejected, None))
+        if resync:
+            self._resync()
+        else:
+            self.library.confirm(self.version)
+        return outcomes
+
+    def _resync(self):
+        """Publica o conteúdo gravado mais as alterações que ainda estão na fila."""
+        with self._lock:
+            pending = list(self._pending)
+            stored, version = self.stored, self.version
+        df = Batch(pending).apply(stored, check=False)[0] if pending else stored
+        self.library.reset(df, version)
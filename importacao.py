@@ -0,0 +1,174 @@
+import json
+from pathlib import Path
+
+import pandas as pd
+import numpy as np
+
+from armazenamento import COLUMNS, TRACK_COLUMNS
+
+# --- IMPORTAÇÃO DE ÁLBUNS EM LOTE ---
+# Lê arquivos CSV (uma linha por faixa), JSON ou JSON Lines (faixas soltas ou
+# álbuns com a lista de faixas em "tracks") em blocos de IMPORT_CHUNK_ROWS
+# faixas. Cada bloco é normalizado e validado de forma vetorizada; as faixas
+# válidas são devolvidas no formato da aba "Musicas", prontas para uma única
+# gravação.
+
+IMPORT_CHUNK_ROWS = 5000
+MIN_YEAR, MAX_YEAR = 1900, 2100
+REQUIRED_FIELDS = ['album', 'artists', 'year', 'title']
+
+
+def _normalized_names(value):
+    if isinstance(value, (list, tuple)):
+        names = [str(name) for name in value]
+    elif isinstance(value, str):
+        names = value.split(';')
+    else:
+        return np.nan
+    names = dict.fromkeys(name.strip() for name in names)
+    names.pop('', None)
+    return '; '.join(names) if names else np.nan
+
+
+def normalize_names(series):
+    """Normaliza listas de nomes (texto separado por ';' ou lista do JSON) para o formato '; ' da planilha.
+
+    Remove espaços e nomes vazios ou repetidos; linhas sem nenhum nome ficam nulas.
+    """
+    return series.map(_normalized_names).astype(object)
+
+
+def _json_tracks(items):
+    """Converte registros do JSON (faixas ou álbuns com "tracks") em um DataFrame de faixas."""
+    tracks = []
+    for item in items:
+        if isinstance(item, dict) and isinstance(item.get('tracks'), list):
+            album = {field: item.get(field) for field in ('album', 'artists', 'year')}
+            for position, track in enumerate(item['tracks'], start=1):
+                track = track if isinstance(track, dict) else {'title': track}
+                tracks.append({**album, 'trackNumber': position, **track})
+        elif isinstance(item, dict):
+            tracks.append(item)
+    return pd.DataFrame(tracks, columns=TRACK_COLUMNS)
+
+
+def _json_records(data):
+    """Lista de registros de um JSON: uma lista no topo ou a lista em "albums"/"tracks"."""
+    if isinstance(data, dict):
+        data = data.get('albums', data.get('tracks', [data]))
+    return data if isinstance(data, list) else []
+
+
+def _chunks(file, filename):
+    """Lê o arquivo em blocos de faixas com as colunas de TRACK_COLUMNS."""
+    suffix = Path(filename).suffix.lower()
+    if suffix == '.csv':
+        for chunk in pd.read_csv(file, chunksize=IMPORT_CHUNK_ROWS, dtype=object, skipinitialspace=True):
+            yield chunk.reindex(columns=TRACK_COLUMNS)
+    elif suffix == '.jsonl':
+        items = []
+        for line in file:
+            line = line.strip()
+            if line:
+                items.append(json.loads(line))
+            if len(items) == IMPORT_CHUNK_ROWS:
+                yield _json_tracks(items)
+                items = []
+        if items:
+            yield _json_tracks(items)
+    elif suffix == '.json':
+        tracks = _json_tracks(_json_records(json.load(file)))
+        for start in range(0, len(tracks), IMPORT_CHUNK_ROWS):
+            yield tracks.iloc[start:start + IMPORT_CHUNK_ROWS]
+    else:
+        raise ValueError(f"Formato de arquivo não suportado: {suffix or filename}")
+
+
+def _track_keys(album, artists, track_number):
+    return pd.MultiIndex.from_arrays([
+        album.astype(object), artists.astype(object), pd.to_numeric(track_number, errors='coerce').astype('float64'),
+    ])
+
+
+class TracklistImport:
+    """Validação incremental das faixas de um arquivo contra a biblioteca existente.
+
+    Mantém as chaves (álbum, artistas, nº da faixa) já vistas no arquivo e a
+    numeração das faixas sem número, para que blocos seguintes sejam conferidos
+    contra os anteriores.
+    """
+
+    def __init__(self, existing):
+        self.existing_keys = _track_keys(existing['album'], existing['artists'], existing['trackNumber'])
+        self.seen_keys = self.existing_keys[:0]
+        self.album_sizes = pd.Series(dtype='int64')
+        self.rows = []
+        self.errors = []
+        self.total = 0
+
+    def _flag(self, chunk, mask, message):
+        if mask.any():
+            self.errors.append(pd.DataFrame({'Faixa do arquivo': chunk.index[mask] + 1, 'Problema': message}))
+
+    def add_chunk(self, chunk):
+        """Normaliza e valida um bloco, guardando as faixas válidas e os erros encontrados."""
+        chunk = chunk.copy()
+        chunk.index = pd.RangeIndex(self.total, self.total + len(chunk))
+        self.total += len(chunk)
+
+        for col in ('album', 'title'):
+            chunk[col] = chunk[col].astype('string').str.strip().replace('', pd.NA)
+        chunk['artists'] = normalize_names(chunk['artists'])
+        chunk['composers'] = normalize_names(chunk['composers'])
+
+        # Faixas sem número seguem a ordem em que aparecem no álbum, inclusive entre blocos
+        album_key = chunk['album'].astype(str) + '\x1f' + chunk['artists'].astype(str)
+        position = chunk.groupby(album_key, sort=False).cumcount() + 1 + album_key.map(self.album_sizes).fillna(0)
+        self.album_sizes = self.album_sizes.add(album_key.value_counts(), fill_value=0)
+        track_number = pd.to_numeric(chunk['trackNumber'], errors='coerce')
+        chunk['trackNumber'] = track_number.where(chunk['trackNumber'].notna(), position)
+        chunk['year'] = pd.to_numeric(chunk['year'], errors='coerce')
+
+        invalid = np.zeros(len(chunk), dtype=bool)
+        for field in REQUIRED_FIELDS:
+            missing = chunk[field].isna().to_numpy()
+            self._flag(chunk, missing, f"Campo obrigatório vazio ou inválido: {field}")
+            invalid |= missing
+        year = chunk['year']
+        bad_year = (year.notna() & ((year % 1 != 0) | (year < MIN_YEAR) | (year > MAX_YEAR))).to_numpy()
+        self._flag(chunk, bad_year, f"Ano fora do intervalo {MIN_YEAR}–{MAX_YEAR}")
+        number = chunk['trackNumber']
+        bad_number = (number.isna() | (number % 1 != 0) | (number < 1)).to_numpy()
+        self._flag(chunk, bad_number, "Número da faixa inválido")
+        invalid |= bad_year | bad_number
+
+        keys = _track_keys(chunk['album'], chunk['artists'], chunk['trackNumber'])
+        in_library = keys.isin(self.existing_keys) & ~invalid
+        self._flag(chunk, in_library, "Faixa já existe na biblioteca (mesmo álbum, artistas e número)")
+        in_file = (keys.duplicated() | keys.isin(self.seen_keys)) & ~invalid & ~in_library
+        self._flag(chunk, in_file, "Faixa repetida no arquivo (mesmo álbum, artistas e número)")
+        invalid |= in_library | in_file
+
+        valid = chunk[~invalid]
+        self.seen_keys = self.seen_keys.append(keys[~invalid])
+        self.rows.append(valid)
+
+    def result(self):
+        """Retorna (faixas válidas no formato da planilha, DataFrame de erros)."""
+        rows = pd.concat(self.rows) if self.rows else pd.DataFrame(columns=TRACK_COLUMNS)
+        rows = rows.reindex(columns=COLUMNS)
+        rows[['trackNumber', 'year']] = rows[['trackNumber', 'year']].astype('int64')
+        errors = pd.concat(self.errors) if self.errors else pd.DataFrame(columns=['Faixa do arquivo', 'Problema'])
+        return rows.reset_index(drop=True), errors.sort_values('Faixa do arquivo', kind='stable').reset_index(drop=True)
+
+
+def read_tracklists(file, filename, existing):
+    """Lê e valida um arquivo de álbuns (CSV, JSON ou JSON Lines) contra a biblioteca `existing`.
+
+    Retorna (faixas válidas, erros, total de faixas lidas).
+    """
+    tracklist = TracklistImport(existing)
+    for chunk in _chunks(file, filename):
+        tracklist.add_chunk(chunk)
+    rows, errors = tracklist.result()
+    return rows, errors, tracklist.total
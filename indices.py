@@ -0,0 +1,677 @@
+import bisect
+import functools
+import re
+from collections import defaultdict
+
+import pandas as pd
+import numpy as np
+
+from armazenamento import rating_columns, rating_users
+
+# --- ÍNDICES DERIVADOS DA BIBLIOTECA ---
+# Estruturas calculadas uma vez por versão dos dados e atualizadas a partir das
+# linhas que cada gravação altera, em vez de recalculadas a cada execução.
+
+
+def explode_names(series):
+    """Separa uma coluna de listas '; ' em uma linha por nome, preservando o índice original.
+
+    Equivale a aplicar `format_string_to_list` em cada linha: valores que não são
+    texto não geram nomes.
+    """
+    if isinstance(series.dtype, pd.CategoricalDtype):
+        series = series.astype(object)
+    text = series[series.map(lambda x: isinstance(x, str))]
+    names = text.str.split(';').explode()
+    return names.str.strip()
+
+
+def _name_counts(series):
+    """Conta as ocorrências de cada nome em uma coluna de listas '; '.
+
+    Cada texto distinto é separado uma única vez e seus nomes herdam a contagem do
+    texto, em vez de separar o texto de cada linha.
+    """
+    texts = series.value_counts()
+    texts = texts[texts > 0]
+    names = explode_names(pd.Series(texts.index.astype(object), index=texts.to_numpy(), dtype=object))
+    return pd.Series(names.index, index=names.to_numpy(), dtype='int64').groupby(level=0).sum()
+
+
+def _field_counts(df):
+    """Retorna, para cada campo do vocabulário, a contagem dos valores presentes nas linhas."""
+    albums = df['album'].value_counts()
+    albums = albums[albums > 0]
+    albums.index = albums.index.astype(object).map(str)
+    return {
+        'artists': _name_counts(df['artists']),
+        'composers': _name_counts(df['composers']),
+        'album': albums.groupby(level=0).sum(),
+        'year': pd.to_numeric(df['year'], errors='coerce').dropna().astype(int).value_counts(),
+    }
+
+
+def _category_objects(column):
+    """Valores de uma coluna categórica como objetos (nulos como None).
+
+    Lê só as categorias usadas pelas linhas: `astype(object)` converte todas as
+    categorias da coluna, o que custa o tamanho da biblioteca mesmo em poucas linhas.
+    """
+    codes = column.cat.codes.to_numpy()
+    values = np.full(len(codes), None, dtype=object)
+    present = codes >= 0
+    values[present] = column.cat.categories[codes[present]].to_numpy(dtype=object)
+    return pd.Series(values, index=column.index, dtype=object, name=column.name)
+
+
+def _as_objects(rows):
+    """Linhas com as colunas categóricas convertidas para objetos.
+
+    Contar valores de um recorte categórico devolve todas as categorias da
+    coluna; como objetos, só os valores presentes nas linhas.
+    """
+    return rows.assign(**{
+        col: _category_objects(rows[col]) for col in rows.columns if isinstance(rows[col].dtype, pd.CategoricalDtype)
+    })
+
+
+class Vocabulary:
+    """Valores distintos da biblioteca (artistas, compositores, álbuns e anos) com suas contagens.
+
+    As contagens ficam em dicionários por campo; uma gravação troca só os
+    dicionários e as listas ordenadas dos campos cujos valores ela alterou.
+    """
+
+    def __init__(self, df):
+        self.counts = {field: dict(zip(values.index.tolist(), values.tolist()))
+                       for field, values in _field_counts(df).items()}
+        self._sorted = {}
+
+    def copy(self):
+        """Cópia independente para atualizar sem alterar o vocabulário original.
+
+        Os dicionários e listas de cada campo são substituídos, nunca alterados,
+        então basta copiar os dicionários externos.
+        """
+        other = Vocabulary.__new__(Vocabulary)
+        other.counts = dict(self.counts)
+        other._sorted = dict(self._sorted)
+        return other
+
+    def _sorted_values(self, field):
+        if field not in self._sorted:
+            self._sorted[field] = sorted(self.counts[field])
+        return self._sorted[field]
+
+    @property
+    def artists(self):
+        return self._sorted_values('artists')
+
+    @property
+    def composers(self):
+        return self._sorted_values('composers')
+
+    @property
+    def albums(self):
+        return self._sorted_values('album')
+
+    @property
+    def years(self):
+        return self._sorted_values('year')
+
+    def _update(self, field, delta):
+        counts = dict(self.counts[field])
+        added, removed = [], []
+        for value, change in zip(delta.index.tolist(), delta.tolist()):
+            count = counts.get(value, 0) + change
+            if count > 0:
+                if value not in counts:
+                    added.append(value)
+                counts[value] = count
+            elif value in counts:
+                del counts[value]
+                removed.append(value)
+        self.counts[field] = counts
+        if field in self._sorted and (added or removed):
+            # Lista ordenada ajustada por busca binária, sem reordenar todos os valores
+            values = list(self._sorted[field])
+            for value in removed:
+                del values[bisect.bisect_left(values, value)]
+            for value in added:
+                bisect.insort(values, value)
+            self._sorted[field] = values
+
+    def apply_changes(self, old_rows, new_rows):
+        """Atualiza as contagens trocando as linhas antigas pelas novas versões gravadas."""
+        old, new = _field_counts(_as_objects(old_rows)), _field_counts(_as_objects(new_rows))
+        for field in self.counts:
+            delta = new[field].sub(old[field], fill_value=0).astype(int)
+            delta = delta[delta != 0]
+            if len(delta):
+                self._update(field, delta)
+
+
+def unique_names(series):
+    """Lista ordenada dos nomes distintos de uma coluna de listas '; '."""
+    return sorted(explode_names(series.dropna()).unique())
+
+
+def _extends(categories, known):
+    """Indica se `categories` começa pelas categorias `known` (categorias só acrescidas depois)."""
+    if categories is known:
+        return True
+    if len(categories) < len(known):
+        return False
+    # Comparação elemento a elemento: `Index.equals` sobre o recorte custa bem mais
+    return bool((categories.array[:len(known)] == known.array).all())
+
+
+class Membership:
+    """Associação nome → linhas para uma coluna de listas '; ' (artistas ou compositores).
+
+    Cada texto distinto da coluna recebe um código e é separado em nomes uma única
+    vez; as linhas guardam apenas o código do seu texto. Filtrar por um conjunto de
+    nomes vira uma consulta no dicionário de nomes seguida de uma indexação
+    vetorizada sobre os códigos das linhas. Numa coluna categórica, os códigos
+    das categorias já vistas são reaproveitados e só as acrescidas são codificadas.
+    """
+
+    def __init__(self, series):
+        self.strings = np.array([], dtype=object)  # texto de cada código
+        self.codes_by_name = {}
+        self.codes = np.array([], dtype='int64')
+        self._code_of = {}
+        self._categories = None
+        self._category_codes = None
+        self.refresh(series)
+
+    def copy(self):
+        """Cópia independente para atualizar sem alterar o índice original.
+
+        As listas de códigos de cada nome e o dicionário de códigos dos textos
+        são substituídos, nunca alterados, então basta copiar o dicionário de nomes.
+        """
+        other = Membership.__new__(Membership)
+        other.__dict__.update(self.__dict__)
+        other.codes_by_name = dict(self.codes_by_name)
+        return other
+
+    def refresh(self, series):
+        """Recalcula os códigos das linhas, separando em nomes apenas os textos ainda não vistos."""
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            categories = series.cat.categories
+            if self._categories is not None and _extends(categories, self._categories):
+                known, category_codes = len(self._categories), self._category_codes
+            else:
+                known, category_codes = 0, np.array([], dtype='int64')
+            if len(categories) > known:
+                new_codes = self._codes_for(categories[known:].to_numpy(dtype=object))
+                category_codes = np.concatenate([category_codes, new_codes])
+            self._categories, self._category_codes = categories, category_codes
+            value_codes = series.cat.codes.to_numpy()
+        else:
+            value_codes, uniques = pd.factorize(series)
+            category_codes = self._codes_for(np.asarray(uniques, dtype=object))
+        # O código -1 (nulo) cai na última posição, também -1
+        self.codes = np.append(category_codes, -1)[value_codes]
+
+    def _lookup(self, values):
+        code_of = self._code_of
+        if not code_of:
+            return np.full(len(values), -1, dtype='int64')
+        return np.fromiter(
+            (code_of.get(value, -1) if isinstance(value, str) else -1 for value in values),
+            dtype='int64', count=len(values),
+        )
+
+    def _codes_for(self, values):
+        """Códigos de textos distintos, registrando e separando em nomes os que ainda não existem."""
+        codes = self._lookup(values)
+        unseen = [value for value, code in zip(values, codes) if code == -1 and isinstance(value, str)]
+        if unseen:
+            start = len(self.strings)
+            self.strings = np.concatenate([self.strings, np.array(unseen, dtype=object)])
+            self._code_of = {**self._code_of, **dict(zip(unseen, range(start, start + len(unseen))))}
+            names = explode_names(pd.Series(unseen, index=range(start, start + len(unseen)), dtype=object))
+            new_codes = pd.Series(names.index.to_numpy(dtype='int64'), index=names.to_numpy())
+            for name, positions in new_codes.groupby(level=0).indices.items():
+                found = new_codes.to_numpy()[positions]
+                known = self.codes_by_name.get(name)
+                self.codes_by_name[name] = found if known is None else np.concatenate([known, found])
+            codes = self._lookup(values)
+        return codes
+
+    def _matching_codes(self, names):
+        parts = [self.codes_by_name[name] for name in names if name in self.codes_by_name]
+        return np.concatenate(parts) if parts else np.array([], dtype='int64')
+
+    def mask(self, names):
+        """Máscara booleana (na ordem da coluna indexada) das linhas que contêm algum dos nomes."""
+        # Tabela de consulta por código; a última posição (código -1) fica sempre falsa
+        hits = np.zeros(len(self.strings) + 1, dtype=bool)
+        hits[self._matching_codes(names)] = True
+        return hits[self.codes]
+
+    def strings_for(self, names):
+        """Textos distintos da coluna que contêm algum dos nomes."""
+        return pd.Index(self.strings[np.unique(self._matching_codes(names))], dtype=object)
+
+
+ALBUM_KEY = ['album', 'artists', 'year']
+
+
+class AlbumStats:
+    """Estatísticas por álbum das notas de todos os usuários.
+
+    Guarda somas por álbum (faixas, faixas avaliadas e soma das notas de cada
+    usuário), calculadas uma vez de forma vetorizada e ajustadas a cada gravação
+    apenas com as linhas alteradas.
+    """
+
+    def __init__(self, df):
+        self.table = self._aggregate(df)
+
+    def copy(self):
+        """Cópia independente para atualizar sem alterar as estatísticas originais."""
+        other = AlbumStats.__new__(AlbumStats)
+        other.table = self.table
+        return other
+
+    @staticmethod
+    def _aggregate(rows):
+        parts = pd.DataFrame({'rows': 1, 'total_tracks': rows['title'].notna()}, index=rows.index)
+        for u, col in zip(rating_users(rows), rating_columns(rows)):
+            ratings = rows[col]
+            parts[f"rated_{u}"] = ratings.notna()
+            parts[f"sum_{u}"] = ratings.fillna(0).astype('float64')
+        # Chaves como objetos: categorias diferentes entre gravações não atrapalham o alinhamento
+        keys = [_category_objects(rows[col]) if isinstance(rows[col].dtype, pd.CategoricalDtype) else rows[col]
+                for col in ALBUM_KEY]
+        return parts.groupby(keys, observed=True).sum()
+
+    def apply_changes(self, old_rows, new_rows):
+        """Atualiza as somas trocando as linhas antigas pelas novas versões gravadas.
+
+        Só as linhas dos álbuns alterados são somadas; alinhar a tabela inteira
+        com `add` custaria o número de álbuns da biblioteca.
+        """
+        delta = self._aggregate(new_rows).sub(self._aggregate(old_rows), fill_value=0)
+        table = self.table
+        if not delta.columns.equals(table.columns):  # coluna de nota nova
+            table = table.add(delta, fill_value=0)
+        else:
+            positions = table.index.get_indexer(delta.index)
+            found = positions >= 0
+            columns = {}
+            for col in table.columns:
+                values = table[col].to_numpy(copy=True)
+                values[positions[found]] += delta[col].to_numpy()[found].astype(values.dtype)
+                columns[col] = values
+            table = pd.DataFrame(columns, index=table.index)
+            if not found.all():  # álbum novo
+                table = pd.concat([table, delta[~found]])
+        if (table['rows'] <= 0).any():
+            table = table[table['rows'] > 0]
+        self.table = table.astype({col: 'int64' for col in table.columns if not col.startswith('sum_')})
+
+    def for_user(self, user):
+        """Estatísticas do usuário: total de faixas, faixas avaliadas, nota média e % concluída."""
+        rated = self.table[f"rated_{user}"]
+        stats = pd.DataFrame({
+            'total_tracks': self.table['total_tracks'],
+            'rated_tracks': rated,
+            'avg_rating': self.table[f"sum_{user}"] / rated.where(rated > 0),
+        }).reset_index()
+        stats['completion_perc'] = (stats['rated_tracks'] / stats['total_tracks']) * 100
+        return stats
+
+
+ALBUM_ID = ['album', 'artists']  # como a edição de álbum identifica um álbum
+
+
+def _album_ids(rows):
+    """Pares (álbum, artistas) das linhas, como texto."""
+    return zip(*(_category_objects(rows[col]) if isinstance(rows[col].dtype, pd.CategoricalDtype) else rows[col]
+                 for col in ALBUM_ID))
+
+
+class AlbumIndex:
+    """Posições das faixas de cada álbum (álbum, artistas) no DataFrame, com ano e número de faixas.
+
+    As posições ficam agrupadas por álbum em um único vetor (`_order`, com o
+    início de cada álbum em `_offsets`); álbuns alterados depois da montagem
+    guardam posições e ano em `_changed`. Consultar ou atualizar um álbum custa
+    o tamanho do álbum, não o da biblioteca.
+    """
+
+    def __init__(self, df):
+        self._build(df)
+
+    def _build(self, df):
+        groups = df.groupby(ALBUM_ID, observed=True, sort=False)
+        # Linhas sem álbum ou artistas não têm grupo (NaN no ngroup) e recebem o código -1
+        codes = groups.ngroup().fillna(-1).to_numpy(dtype='int64')
+        self._base = groups.agg(year=('year', 'first'), tracks=('title', 'size'))
+        # As de código -1 ficam no começo do vetor, antes do primeiro álbum e fora de qualquer um
+        self._order = np.argsort(codes, kind='stable')
+        counts = np.bincount(codes[codes >= 0], minlength=len(self._base))
+        self._offsets = np.concatenate([[0], np.cumsum(counts)]) + np.count_nonzero(codes < 0)
+        self._group_of = dict(zip(self._base.index, range(len(self._base))))
+        self._changed = {}
+        self.__dict__.pop('table', None)
+
+    def copy(self):
+        """Cópia independente para atualizar sem alterar o índice original."""
+        other = AlbumIndex.__new__(AlbumIndex)
+        other.__dict__.update(self.__dict__)
+        other._changed = dict(self._changed)
+        return other
+
+    def positions(self, album, artists):
+        """Posições das faixas do álbum no DataFrame, em ordem crescente."""
+        key = (album, artists)
+        if key in self._changed:
+            return self._changed[key][0]
+        group = self._group_of.get(key)
+        if group is None:
+            return np.array([], dtype='int64')
+        return self._order[self._offsets[group]:self._offsets[group + 1]]
+
+    def year(self, album, artists):
+        """Ano do álbum (o da primeira faixa que o informa), ou NA."""
+        key = (album, artists)
+        if key in self._changed:
+            return self._changed[key][1]
+        group = self._group_of.get(key)
+        return pd.NA if group is None else self._base['year'].iat[group]
+
+    @functools.cached_property
+    def table(self):
+        """Ano e número de faixas de todos os álbuns, indexados por (álbum, artistas)."""
+        if not self._changed:
+            return self._base
+        changed = pd.DataFrame(
+            [(album, artists, year, len(positions)) for (album, artists), (positions, year) in self._changed.items()
+             if len(positions)],
+            columns=ALBUM_ID + ['year', 'tracks'],
+        ).set_index(ALBUM_ID)
+        table = self._base[~self._base.index.isin(list(self._changed))]
+        return pd.concat([table, changed.astype(table.dtypes.to_dict())])
+
+    def apply_changes(self, df, old_rows, new_rows):
+        """Move as linhas alteradas para os seus álbuns atuais e recalcula o ano desses álbuns.
+
+        `df` é o DataFrame novo. Linhas removidas deslocam as posições seguintes;
+        nesse caso o índice é refeito.
+        """
+        positions = df.index.get_indexer(new_rows.index)
+        if (positions < 0).any() or not old_rows.index.isin(new_rows.index).all():
+            self._build(df)
+            return
+        old_positions = pd.Series(positions, index=new_rows.index).loc[old_rows.index]
+
+        moves = defaultdict(lambda: ([], []))
+        for key, position in zip(_album_ids(old_rows), old_positions):
+            moves[key][0].append(position)
+        for key, position in zip(_album_ids(new_rows), positions):
+            moves[key][1].append(position)
+        years = df['year'].array
+        for key, (leaving, arriving) in moves.items():
+            if pd.isna(key[0]) or pd.isna(key[1]):
+                continue
+            album_positions = np.union1d(np.setdiff1d(self.positions(*key), leaving), arriving).astype('int64')
+            album_years = years[album_positions]
+            album_years = album_years[~album_years.isna()]
+            self._changed[key] = (album_positions, album_years[0] if len(album_years) else pd.NA)
+        self.__dict__.pop('table', None)
+
+
+# --- MATRIZ DE NOTAS ---
+# As notas de todos os usuários (uma coluna rating_<usuário> cada) ficam numa
+# matriz faixas × usuários; um usuário novo é só uma coluna a mais. As
+# estatísticas entre usuários saem de operações sobre a matriz inteira e são
+# guardadas na primeira consulta: a matriz pertence a um único instantâneo da
+# biblioteca, então o resultado vale até a próxima versão dos dados.
+
+AGREEMENT_TOLERANCE = 1.0  # notas de dois usuários a até esta distância contam como concordância
+MIN_COMMON_TRACKS = 3  # faixas em comum necessárias para calcular a correlação
+
+
+def _ratio(numerator, denominator):
+    """Divisão elemento a elemento, com NaN onde o denominador é zero."""
+    return np.divide(numerator, denominator, out=np.full(np.shape(numerator), np.nan), where=denominator > 0)
+
+
+class RatingsMatrix:
+    """Notas da biblioteca como matriz faixas × usuários (NaN onde não há nota), na ordem das linhas do DataFrame."""
+
+    def __init__(self, df, album_stats):
+        self.users = rating_users(df)
+        self.values = df[rating_columns(df)].to_numpy(dtype='float64', na_value=np.nan)
+        self.rated = ~np.isnan(self.values)
+        self.album_stats = album_stats
+
+    def means(self, rows=None):
+        """Nota média de cada usuário nas linhas informadas (posições ou máscara; todas, se None)."""
+        values, rated = (self.values, self.rated) if rows is None else (self.values[rows], self.rated[rows])
+        sums = np.where(rated, values, 0.0).sum(axis=0)
+        return pd.Series(_ratio(sums, rated.sum(axis=0)), index=self.users)
+
+    @functools.cached_property
+    def agreement(self):
+        """Comparação de cada par de usuários nas faixas que os dois avaliaram.
+
+        Colunas: faixas em comum, correlação de Pearson, diferença média (notas
+        do primeiro menos as do segundo), diferença absoluta média e % de faixas
+        com notas a até AGREEMENT_TOLERANCE uma da outra.
+        """
+        filled = np.where(self.rated, self.values, 0.0)
+        both = self.rated.astype('float64')
+        # Somas sobre as faixas avaliadas pelos dois usuários de cada par, como produtos de matrizes:
+        # sum_a[a, b] soma as notas de `a` nas faixas que `b` também avaliou
+        common = both.T @ both
+        sum_a = filled.T @ both
+        sum_aa = (filled * filled).T @ both
+        sum_ab = filled.T @ filled
+        cov = common * sum_ab - sum_a * sum_a.T
+        var = (common * sum_aa - sum_a ** 2) * (common * sum_aa.T - sum_a.T ** 2)
+        correlation = _ratio(cov, np.sqrt(np.clip(var, 0, None)))
+        correlation[common < MIN_COMMON_TRACKS] = np.nan
+
+        # Diferenças absolutas não cabem em produtos: uma passagem por usuário contra todos os outros
+        abs_diff = np.zeros_like(common)
+        close = np.zeros_like(common)
+        for i in range(len(self.users)):
+            shared = self.rated[:, [i]] & self.rated
+            diff = np.abs(filled[:, [i]] - filled)
+            abs_diff[i] = np.where(shared, diff, 0.0).sum(axis=0)
+            close[i] = (shared & (diff <= AGREEMENT_TOLERANCE)).sum(axis=0)
+
+        a, b = np.triu_indices(len(self.users), k=1)
+        users = np.array(self.users, dtype=object)
+        return pd.DataFrame({
+            'user_a': users[a],
+            'user_b': users[b],
+            'common_tracks': common[a, b].astype('int64'),
+            'correlation': correlation[a, b],
+            'mean_difference': _ratio(sum_a - sum_a.T, common)[a, b],
+            'mean_abs_difference': _ratio(abs_diff, common)[a, b],
+            'agreement_perc': _ratio(close, common)[a, b] * 100,
+        })
+
+    @functools.cached_property
+    def album_averages(self):
+        """Nota média de cada usuário por álbum (álbuns × usuários), a partir das somas de `AlbumStats`."""
+        table = self.album_stats.table
+        sums = table[[f"sum_{u}" for u in self.users]].to_numpy(dtype='float64')
+        rated = table[[f"rated_{u}" for u in self.users]].to_numpy()
+        return pd.DataFrame(_ratio(sums, rated), index=table.index, columns=self.users)
+
+    @functools.cached_property
+    def album_rankings(self):
+        """Álbuns com alguma nota, do melhor para o pior pela média entre os usuários que os avaliaram.
+
+        Cada usuário pesa o mesmo na média, não importa quantas faixas avaliou.
+        Colunas: chave do álbum, total de faixas, a média de cada usuário,
+        `avg_rating`, `raters` (usuários com nota) e `rank`.
+        """
+        averages = self.album_averages
+        raters = averages.notna().sum(axis=1)
+        rankings = pd.concat([self.album_stats.table['total_tracks'], averages], axis=1)
+        rankings['avg_rating'] = averages.sum(axis=1) / raters.where(raters > 0)
+        rankings['raters'] = raters
+        rankings = rankings[raters > 0]
+        rankings['rank'] = rankings['avg_rating'].rank(ascending=False, method='min').astype('int64')
+        return rankings.sort_values('rank', kind='stable').reset_index()
+
+
+# --- BUSCA TEXTUAL ---
+
+SEARCH_FIELDS = {'title': 3.0, 'album': 2.0, 'artists': 2.0, 'composers': 1.0}  # peso de cada campo no ranking
+EXACT_TOKEN_BONUS = 0.5  # palavra igual à da busca vale mais que só o prefixo
+MAX_SEGMENTS = 8
+
+
+def fold_text(series):
+    """Minúsculas e sem acentos ("Canção" → "cancao"), para comparar textos em português."""
+    return (series.astype(object).astype('string').str.normalize('NFKD')
+            .str.encode('ascii', 'ignore').str.decode('ascii').str.lower())
+
+
+def search_tokens(text):
+    """Palavras de um texto de busca, já sem acentos e em minúsculas."""
+    folded = fold_text(pd.Series([text])).iloc[0]
+    return [token for token in re.split(r"[^0-9a-z]+", folded) if token] if isinstance(folded, str) else []
+
+
+class _Postings:
+    """Palavras de um conjunto de textos em ordem alfabética, cada uma com os códigos dos textos que a contêm.
+
+    Os textos são separados primeiro nos trechos entre ';' (os nomes, em artistas
+    e compositores), e só os trechos distintos passam pela remoção de acentos e
+    pela separação em palavras.
+    """
+
+    def __init__(self, texts, first_code):
+        pieces = pd.Series(texts, dtype=object).str.split(';').explode().str.strip()
+        piece_ids, distinct = pd.factorize(pieces)
+        tokens = fold_text(pd.Series(distinct, dtype=object)).str.split(r"[^0-9a-z]+", regex=True).explode()
+        tokens = tokens[tokens.notna() & (tokens != '')]
+        token_ids, vocabulary = pd.factorize(tokens)
+
+        pairs = pd.DataFrame({'code': pieces.index.to_numpy() + first_code, 'piece': piece_ids}).merge(
+            pd.DataFrame({'piece': tokens.index.to_numpy(), 'token': token_ids}), on='piece',
+        )[['token', 'code']].drop_duplicates()
+
+        # Ordena as palavras alfabeticamente e os pares por (palavra, texto)
+        order = np.argsort(np.asarray(vocabulary, dtype=object))
+        rank = np.empty(len(order), dtype='int64')
+        rank[order] = np.arange(len(order))
+        token_rank = rank[pairs['token'].to_numpy()]
+        codes = pairs['code'].to_numpy(dtype='int64')
+        by_token = np.lexsort((codes, token_rank))
+        self.vocabulary = np.asarray(vocabulary, dtype=object)[order]
+        self.offsets = np.searchsorted(token_rank[by_token], np.arange(len(order) + 1))
+        self.codes = codes[by_token]
+
+    def matches(self, token):
+        """Códigos dos textos com alguma palavra começando por `token` e dos que têm a palavra exata."""
+        lo = np.searchsorted(self.vocabulary, token, side='left')
+        hi = np.searchsorted(self.vocabulary, token + '\uffff', side='left')
+        prefix = self.codes[self.offsets[lo]:self.offsets[hi]]
+        exact = self.codes[self.offsets[lo]:self.offsets[lo + 1]] if lo < hi and self.vocabulary[lo] == token else prefix[:0]
+        return prefix, exact
+
+
+class _SearchField:
+    """Índice de busca de uma coluna: textos distintos, código do texto de cada linha e segmentos de palavras.
+
+    Textos novos (de gravações) entram em um segmento próprio; com muitos
+    segmentos, eles são fundidos em um só.
+    """
+
+    def __init__(self, series):
+        self.strings = pd.Index([], dtype=object)
+        self.segments = []
+        self.codes = np.array([], dtype='int64')
+        self.refresh(series)
+
+    def copy(self):
+        other = _SearchField.__new__(_SearchField)
+        other.strings, other.segments, other.codes = self.strings, list(self.segments), self.codes
+        return other
+
+    def _codes_for(self, values):
+        codes = self.strings.get_indexer(values)
+        unseen = pd.Index(values[(codes == -1) & pd.notna(values)]).unique()
+        if len(unseen):
+            start = len(self.strings)
+            self.strings = self.strings.append(pd.Index(unseen.astype(object), dtype=object))
+            if len(self.segments) >= MAX_SEGMENTS:
+                self.segments = [_Postings(self.strings, 0)]
+            else:
+                self.segments.append(_Postings(unseen.astype(object), start))
+            codes = self.strings.get_indexer(values)
+        return codes
+
+    def refresh(self, series):
+        """Recalcula os códigos das linhas, indexando apenas os textos ainda não vistos."""
+        # Só os valores distintos são procurados; o código -1 (nulo) cai na última posição, também -1
+        if isinstance(series.dtype, pd.CategoricalDtype):
+            value_codes, values = series.cat.codes.to_numpy(), series.cat.categories
+        else:
+            value_codes, values = pd.factorize(series)
+        self.codes = np.append(self._codes_for(np.asarray(values, dtype=object)), -1)[value_codes]
+
+    def scores(self, token, weight):
+        """Pontuação de cada linha para uma palavra da busca (0 onde não há correspondência)."""
+        table = np.zeros(len(self.strings) + 1, dtype='float32')  # última posição: linhas sem texto
+        for segment in self.segments:
+            prefix, exact = segment.matches(token)
+            table[prefix] = weight
+            table[exact] = weight + EXACT_TOKEN_BONUS
+        return table[self.codes]
+
+
+class SearchIndex:
+    """Busca por palavras (ou prefixos) em título, álbum, artistas e compositores, sem diferenciar acentos.
+
+    Uma linha corresponde à busca se cada palavra buscada for prefixo de alguma
+    palavra de algum dos campos; a relevância soma o peso dos campos em que cada
+    palavra aparece.
+    """
+
+    def __init__(self, df):
+        self.fields = {field: _SearchField(df[field]) for field in SEARCH_FIELDS}
+
+    def copy(self):
+        """Cópia independente para atualizar sem alterar o índice original."""
+        other = SearchIndex.__new__(SearchIndex)
+        other.fields = {field: index.copy() for field, index in self.fields.items()}
+        return other
+
+    def refresh(self, df):
+        """Acompanha o DataFrame gravado, indexando só os textos novos."""
+        for field, index in self.fields.items():
+            index.refresh(df[field])
+
+    def search(self, query, mask=None, limit=None):
+        """Posições das linhas que correspondem à busca, da mais para a menos relevante.
+
+        `mask` restringe a busca às linhas marcadas; `limit` devolve só as primeiras.
+        """
+        tokens = search_tokens(query)
+        if not tokens:
+            return np.array([], dtype='int64')
+        total = None
+        for token in dict.fromkeys(tokens):
+            token_score = sum(index.scores(token, SEARCH_FIELDS[field]) for field, index in self.fields.items())
+            matched = token_score > 0
+            total = token_score if total is None else np.where(matched & (total > 0), total + token_score, 0)
+        if mask is not None:
+            total = np.where(mask, total, 0)
+        positions = np.flatnonzero(total)
+        if limit is not None and len(positions) > limit:
+            positions = positions[np.argpartition(-total[positions], limit - 1)[:limit]]
+            positions.sort()
+        return positions[np.argsort(-total[positions], kind='stable')]
@@ -2,6 +2,14 @@ import streamlit as st
 import pandas as pd
 from streamlit_gsheets import GSheetsConnection
 import numpy as np
+import math
+import functools
+from armazenamento import rating_users, set_cells, with_new_rows
+from backends import GSheetsBackend, SQLiteBackend
+from compartilhado import SharedLibrary
+from importacao import read_tracklists
+from indices import AGREEMENT_TOLERANCE, unique_names
+from instrumentacao import phase, span, start_run
 
 # --- CONFIGURAÇÃO DA PÁGINA ---
 st.set_page_config(
@@ -42,6 +50,81 @@ def format_string_to_list(data_string):
         return [item.strip() for item in data_string.split(';')]
     return []
 
+PAGE_SIZES = [10, 25, 50, 100]
+DEFAULT_PAGE_SIZE = 25
+
+def paginate(frame, key):
+    """Mostra os controles de paginação e retorna apenas as linhas da página atual."""
+    page_key = f"{key}_page"
+    c1, c2, c3 = st.columns([2, 2, 6])
+    page_size = c1.selectbox("Álbuns por página", PAGE_SIZES, index=PAGE_SIZES.index(DEFAULT_PAGE_SIZE), key=f"{key}_page_size")
+    total_pages = max(1, math.ceil(len(frame) / page_size))
+
+    # Volta para uma página válida quando filtros ou tamanho da página reduzem o total
+    if st.session_state.get(page_key, 1) > total_pages:
+        st.session_state[page_key] = total_pages
+
+    page_number = c2.number_input("Página", min_value=1, max_value=total_pages, step=1, key=page_key)
+    c3.caption(f"{len(frame)} álbuns · página {page_number} de {total_pages}")
+    start = (page_number - 1) * page_size
+    return frame.iloc[start:start + page_size]
+
+# --- INSTRUMENTAÇÃO DE DESEMPENHO ---
+# Execuções interrompidas por st.rerun() são registradas no início da seguinte
+previous_profiler = st.session_state.get('profiler')
+if previous_profiler is not None and previous_profiler.total is None:
+    previous_profiler.finish(interrupted=True)
+profiler = start_run(st.session_state.get('debug_profiling', False), st.session_state.get('user'))
+st.session_state.profiler = profiler
+
+# --- CONEXÃO COM O ARMAZENAMENTO E CARREGAMENTO DOS DADOS ---
+@st.cache_resource
+def get_backend():
+    """Escolhe o backend pela seção [storage] dos secrets; o padrão é o Google Sheets."""
+    try:
+        settings = dict(st.secrets.get("storage", {}))
+        connections = dict(st.secrets.get("connections", {}))
+    except Exception:
+        settings, connections = {}, {}
+    if settings.get("backend") == "sqlite":
+        backend = SQLiteBackend(settings.get("path", "biblioteca.db"))
+        # Banco novo: começa com a biblioteca da planilha, se houver uma conexão configurada
+        if backend.is_empty() and "gsheets" in connections:
+            sheet = GSheetsBackend(st.connection("gsheets", type=GSheetsConnection))
+            backend.replace_all(sheet.load(sheet.version()))
+        return backend
+    return GSheetsBackend(st.connection("gsheets", type=GSheetsConnection))
+
+@st.cache_data(ttl=30, show_spinner=False)
+def get_data_version(_backend):
+    """Consulta a versão dos dados no máximo uma vez a cada 30 segundos."""
+    return _backend.version()
+
+@st.cache_resource
+def get_library(_backend):
+    """Biblioteca compartilhada por todas as sessões deste processo."""
+    return SharedLibrary(_backend)
+
+try:
+    backend = get_backend()
+    library = get_library(backend)
+    with span("versão dos dados"):
+        version = get_data_version(backend)
+
+    # A sessão só referencia o instantâneo do processo; ele é recarregado quando a versão muda
+    snapshot = library.current(version)
+
+except Exception as e:
+    st.error(f"Não foi possível conectar ao armazenamento. Verifique a configuração e o nome da planilha/aba. Erro: {e}")
+    st.stop()
+
+df = snapshot.df
+vocab = snapshot.vocab
+artist_index = snapshot.artist_index
+composer_index = snapshot.composer_index
+# Usuários vêm das colunas de nota (rating_<usuário>) dos dados
+users = rating_users(df)
+
 # --- TELA DE LOGIN ---
 if 'user' not in st.session_state:
     st.session_state.user = None
@@ -50,7 +133,7 @@ if st.session_state.user is None:
     st.title("Bem-vindo à sua Biblioteca Musical 🎵")
     st.subheader("Por favor, selecione seu usuário para continuar")
     
-    user_login = st.selectbox("Selecione o usuário:", ["", "jom", "jov", "job"])
+    user_login = st.selectbox("Selecione o usuário:", [""] + users)
     
     if st.button("Entrar"):
         if user_login:
@@ -67,180 +150,428 @@ if st.sidebar.button("Logout"):
         del st.session_state[key]
     st.rerun()
 
-# --- CONEXÃO COM GOOGLE SHEETS E CARREGAMENTO DOS DADOS ---
-try:
-    conn = st.connection("gsheets", type=GSheetsConnection)
-    df = conn.read(worksheet="Musicas", usecols=list(range(9)), ttl=5)
-    df = df.dropna(how="all") # Remove linhas completamente vazias
-
-    # Garante que as colunas de avaliação existam
-    for u in ["jom", "jov", "job"]:
-        col_name = f"rating_{u}"
-        if col_name not in df.columns:
-            df[col_name] = np.nan
+USER_RATING_COL = f"rating_{st.session_state.user}"
 
-    # Conversão de tipos e tratamento de dados
-    df['trackNumber'] = pd.to_numeric(df['trackNumber'], errors='coerce')
-    df['year'] = pd.to_numeric(df['year'], errors='coerce')
-    for u in ["jom", "jov", "job"]:
-        df[f"rating_{u}"] = pd.to_numeric(df[f"rating_{u}"], errors='coerce')
+# --- RESULTADO DAS GRAVAÇÕES EM SEGUNDO PLANO ---
+still_pending = []
+for edit_id in st.session_state.get('pending_edits', []):
+    edit = library.writer.take(edit_id)
+    if edit is None:
+        continue
+    if edit.status == 'pending':
+        still_pending.append(edit_id)
+        continue
+    if profiler is not None and edit.profile is not None:
+        profiler.merge_io(edit.profile['io'], "fila")
+    if edit.status == 'saved':
+        st.toast("✅ Alterações gravadas.")
+    elif edit.status == 'conflict':
+        st.warning(f"{len(edit.rejected)} campo(s) da sua alteração não foram gravados porque outra pessoa os alterou antes. Confira os valores atuais.")
+    else:
+        st.error(f"Não foi possível gravar uma alteração: {edit.error}")
+st.session_state.pending_edits = still_pending
+if still_pending:
+    st.sidebar.caption(f"⏳ Gravando {len(still_pending)} alteração(ões)...")
 
-    st.session_state.df = df
+def persist(df_updated, rows=None):
+    """Publica as alterações para todas as sessões na hora e as envia à fila de gravação em segundo plano.
 
-except Exception as e:
-    st.error(f"Não foi possível conectar ao Google Sheets. Verifique a configuração e o nome da planilha/aba. Erro: {e}")
-    st.stop()
-
-df = st.session_state.df
-USER_RATING_COL = f"rating_{st.session_state.user}"
+    `rows` restringe a comparação às linhas editadas (edição de álbum).
+    """
+    with span("atualização dos índices"):
+        edit_id = library.save(snapshot, df_updated, st.session_state.user, rows)
+    st.session_state.pending_edits = st.session_state.get('pending_edits', []) + [edit_id]
 
 # --- NAVEGAÇÃO NA SIDEBAR ---
 st.sidebar.title("Navegação")
 page = st.sidebar.radio(
     "Selecione uma página:",
-    ("📚 Minha Biblioteca", "➕ Adicionar Dados", "🎧 Próximos a Ouvir", "🏆 Álbuns Concluídos")
+    ("📚 Minha Biblioteca", "➕ Adicionar Dados", "🎧 Próximos a Ouvir", "🏆 Álbuns Concluídos", "👥 Comparar Notas")
 )
 st.sidebar.markdown("---")
+if profiler is not None:
+    profiler.page = page
+st.sidebar.toggle("⏱️ Diagnóstico de desempenho", key="debug_profiling", help="Mede cada fase da execução e as chamadas ao armazenamento.")
+debug_panel = st.sidebar.empty()
+
+def finish_profiling():
+    """Encerra o perfil da execução e mostra o resultado no painel de diagnóstico."""
+    if profiler is None:
+        return
+    record = profiler.finish()
+    with debug_panel.container():
+        st.caption(f"Execução: {record['total_ms']:.1f} ms")
+        spans = pd.DataFrame(record['spans'])
+        if not spans.empty:
+            spans['name'] = [" " * depth + name for depth, name in zip(spans['depth'], spans['name'])]
+            st.dataframe(spans[['name', 'ms']].rename(columns={'name': 'Fase'}), hide_index=True, use_container_width=True)
+        if record['io']:
+            io = pd.DataFrame.from_dict(record['io'], orient='index')
+            st.dataframe(io.rename_axis('Operação'), use_container_width=True)
 
 # --- LÓGICA DE EDIÇÃO DE ÁLBUM (MODAL) ---
 if 'editing_album' in st.session_state and st.session_state.editing_album:
     album_to_edit, artist_to_edit = st.session_state.editing_album
+    phase("edição de álbum")
     
     st.header(f"✏️ Editando Álbum: {album_to_edit} - {artist_to_edit}")
 
-    album_df = df[(df['album'] == album_to_edit) & (df['artists'] == artist_to_edit)].copy()
+    album_df = df.iloc[snapshot.album_index.positions(album_to_edit, artist_to_edit)].copy()
     album_df = album_df.sort_values(by='trackNumber').reset_index()
 
-    with st.form("edit_album_form"):
-        st.subheader("Informações do Álbum")
+    # Álbuns longos abrem direto no editor em tabela
+    edit_mode = st.radio("Modo de edição", ("Formulário", "Tabela"), index=1 if len(album_df) > 30 else 0, horizontal=True)
+
+    if edit_mode == "Tabela":
+        rating_options = [round(x, 1) for x in np.arange(0.0, 10.5, 0.5)]
+        grid_columns = ['trackNumber', 'title', 'composers'] + [f"rating_{u}" for u in users]
+        # Compositores em texto livre no editor (como categoria, virariam uma lista fixa de opções)
+        grid = album_df.set_index('index')[grid_columns].astype({'composers': object})
+
+        with st.form("edit_album_grid_form"):
+            st.subheader("Informações do Álbum")
+            current_artists_list = format_string_to_list(album_df['artists'].iloc[0])
+            edited_artists = st.multiselect("Artistas", options=vocab.artists, default=current_artists_list)
+            edited_album_title = st.text_input("Título do Álbum", value=album_df['album'].iloc[0])
+            edited_year = st.number_input("Ano", value=int(album_df['year'].iloc[0]), min_value=1900, max_value=2100)
+
+            st.subheader("Faixas")
+            rating_config = {
+                f"rating_{u}": st.column_config.SelectboxColumn(f"Nota ({u.upper()})", options=rating_options)
+                if u == st.session_state.user else
+                st.column_config.NumberColumn(f"Nota ({u.upper()})", format="%.1f", disabled=True)
+                for u in users
+            }
+            edited_grid = st.data_editor(
+                grid,
+                column_config={
+                    'trackNumber': st.column_config.NumberColumn("Nº", min_value=1, step=1, required=True),
+                    'title': st.column_config.TextColumn("Título da Faixa", required=True),
+                    'composers': st.column_config.TextColumn("Compositores", help="Separe os nomes com ';'"),
+                    **rating_config,
+                },
+                hide_index=True,
+                num_rows="fixed",
+                use_container_width=True,
+            )
+
+            submitted = st.form_submit_button("Salvar Alterações")
+            if submitted:
+                # Só as células que mudaram são copiadas para o DataFrame gravado
+                changed_cells = ~((edited_grid == grid) | (edited_grid.isna() & grid.isna())).fillna(False)
+                df_updated = df.copy()
+                for col in grid_columns:
+                    rows = changed_cells.index[changed_cells[col]]
+                    if col == 'composers':
+                        values = edited_grid.loc[rows, col].map(
+                            lambda x: format_list_to_string([name for name in format_string_to_list(x) if name])
+                        )
+                    else:
+                        values = edited_grid.loc[rows, col]
+                    set_cells(df_updated, rows, col, values)
+
+                album_fields = {'artists': format_list_to_string(edited_artists), 'album': edited_album_title, 'year': edited_year}
+                album_changes = {col: value for col, value in album_fields.items() if value != album_df[col].iloc[0]}
+                for col, value in album_changes.items():
+                    set_cells(df_updated, grid.index, col, value)
+
+                if changed_cells.to_numpy().any() or album_changes:
+                    persist(df_updated, rows=grid.index)
+                    st.success(f"Álbum '{edited_album_title}' atualizado com sucesso!")
+                    st.session_state.editing_album = None
+                    st.rerun()
+                else:
+                    st.info("Nenhuma alteração para salvar.")
+
+    else:
+        with st.form("edit_album_form"):
+            st.subheader("Informações do Álbum")
         
-        current_artists_list = format_string_to_list(album_df['artists'].iloc[0])
-        all_artists = sorted(list(set(item for sublist in df['artists'].dropna().apply(format_string_to_list) for item in sublist)))
+            current_artists_list = format_string_to_list(album_df['artists'].iloc[0])
+            all_artists = vocab.artists
         
-        edited_artists = st.multiselect("Artistas", options=all_artists, default=current_artists_list)
-        edited_album_title = st.text_input("Título do Álbum", value=album_df['album'].iloc[0])
-        edited_year = st.number_input("Ano", value=int(album_df['year'].iloc[0]), min_value=1900, max_value=2100)
+            edited_artists = st.multiselect("Artistas", options=all_artists, default=current_artists_list)
+            edited_album_title = st.text_input("Título do Álbum", value=album_df['album'].iloc[0])
+            edited_year = st.number_input("Ano", value=int(album_df['year'].iloc[0]), min_value=1900, max_value=2100)
 
-        st.subheader("Faixas")
+            st.subheader("Faixas")
         
-        edited_tracks = []
-        for index, row in album_df.iterrows():
-            st.markdown(f"---")
-            cols = st.columns([1, 4, 4, 2])
+            edited_tracks = []
+            for index, row in album_df.iterrows():
+                st.markdown(f"---")
+                cols = st.columns([1, 4, 4, 2])
             
-            new_track_number = cols[0].number_input("Nº", value=int(row['trackNumber']), key=f"num_{index}", min_value=1)
-            new_title = cols[1].text_input("Título da Faixa", value=row['title'], key=f"title_{index}")
+                new_track_number = cols[0].number_input("Nº", value=int(row['trackNumber']), key=f"num_{index}", min_value=1)
+                new_title = cols[1].text_input("Título da Faixa", value=row['title'], key=f"title_{index}")
             
-            current_composers_list = format_string_to_list(row['composers'])
-            all_composers = sorted(list(set(item for sublist in df['composers'].dropna().apply(format_string_to_list) for item in sublist)))
-            new_composers = cols[2].multiselect("Compositores", options=all_composers, default=current_composers_list, key=f"comp_{index}")
+                current_composers_list = format_string_to_list(row['composers'])
+                all_composers = vocab.composers
+                new_composers = cols[2].multiselect("Compositores", options=all_composers, default=current_composers_list, key=f"comp_{index}")
             
-            ratings = {}
-            for u in ["jom", "jov", "job"]:
-                rating_col = f"rating_{u}"
-                is_current_user = (u == st.session_state.user)
-                current_rating = row[rating_col]
-
-                if is_current_user:
-                    rating_options = ["Sem nota"] + [round(x, 1) for x in np.arange(0.0, 10.5, 0.5)]
+                ratings = {}
+                for u in users:
+                    rating_col = f"rating_{u}"
+                    is_current_user = (u == st.session_state.user)
+                    current_rating = row[rating_col]
+
+                    if is_current_user:
+                        rating_options = ["Sem nota"] + [round(x, 1) for x in np.arange(0.0, 10.5, 0.5)]
                     
-                    if pd.isna(current_rating):
-                        current_index = 0
-                    else:
-                        try:
-                            current_index = rating_options.index(current_rating)
-                        except ValueError:
+                        if pd.isna(current_rating):
                             current_index = 0
+                        else:
+                            try:
+                                current_index = rating_options.index(current_rating)
+                            except ValueError:
+                                current_index = 0
+
+                        selected_rating = cols[3].selectbox(
+                            f"Nota ({u.upper()})",
+                            options=rating_options,
+                            index=current_index,
+                            key=f"rating_{u}_{index}"
+                        )
+
+                        if selected_rating == "Sem nota":
+                            ratings[rating_col] = np.nan
+                        else:
+                            ratings[rating_col] = float(selected_rating)
+                    else:
+                        cols[3].metric(f"Nota ({u.upper()})", f"{current_rating:.1f}" if pd.notna(current_rating) else "N/A")
+                        ratings[rating_col] = current_rating
 
-                    selected_rating = cols[3].selectbox(
-                        f"Nota ({u.upper()})",
-                        options=rating_options,
-                        index=current_index,
-                        key=f"rating_{u}_{index}"
-                    )
+                track_data = {'trackNumber': new_track_number, 'title': new_title, 'composers': format_list_to_string(new_composers), **ratings}
+                edited_tracks.append(track_data)
 
-                    if selected_rating == "Sem nota":
-                        ratings[rating_col] = np.nan
-                    else:
-                        ratings[rating_col] = float(selected_rating)
-                else:
-                    cols[3].metric(f"Nota ({u.upper()})", f"{current_rating:.1f}" if pd.notna(current_rating) else "N/A")
-                    ratings[rating_col] = current_rating
-
-            track_data = {'trackNumber': new_track_number, 'title': new_title, 'composers': format_list_to_string(new_composers), **ratings}
-            edited_tracks.append(track_data)
-
-        submitted = st.form_submit_button("Salvar Alterações")
-        if submitted:
-            original_indices = df[(df['album'] == album_to_edit) & (df['artists'] == artist_to_edit)].index
-            df.drop(original_indices, inplace=True)
-
-            new_rows = []
-            for track in edited_tracks:
-                new_row = {
-                    'trackNumber': track['trackNumber'], 'title': track['title'], 'artists': format_list_to_string(edited_artists),
-                    'album': edited_album_title, 'year': edited_year, 'composers': track['composers'],
-                    'rating_jom': track['rating_jom'], 'rating_jov': track['rating_jov'], 'rating_job': track['rating_job']
-                }
-                new_rows.append(new_row)
-            
-            new_df = pd.DataFrame(new_rows)
-            df_updated = pd.concat([df, new_df], ignore_index=True)
+            submitted = st.form_submit_button("Salvar Alterações")
+            if submitted:
+                # Atualiza as faixas nas mesmas linhas para gravar apenas o que mudou
+                new_rows = []
+                for track in edited_tracks:
+                    new_row = {
+                        'trackNumber': track['trackNumber'], 'title': track['title'], 'artists': format_list_to_string(edited_artists),
+                        'album': edited_album_title, 'year': edited_year, 'composers': track['composers'],
+                        **{f"rating_{u}": track[f"rating_{u}"] for u in users}
+                    }
+                    new_rows.append(new_row)
             
-            conn.update(worksheet="Musicas", data=df_updated)
+                new_df = pd.DataFrame(new_rows, index=album_df['index'].values)
+                df_updated = df.copy()
+                for col in new_df.columns:
+                    set_cells(df_updated, new_df.index, col, new_df[col])
+
+                persist(df_updated, rows=new_df.index)
             
-            st.success(f"Álbum '{edited_album_title}' atualizado com sucesso!")
-            st.session_state.editing_album = None
-            st.rerun()
+                st.success(f"Álbum '{edited_album_title}' atualizado com sucesso!")
+                st.session_state.editing_album = None
+                st.rerun()
 
     if st.button("Cancelar Edição"):
         st.session_state.editing_album = None
         st.rerun()
     
+    finish_profiling()
     st.stop()
 
-# --- RENDERIZAÇÃO DAS PÁGINAS ---
-
-if page == "📚 Minha Biblioteca":
-    st.title("📚 Minha Biblioteca")
-    st.header("Explore sua coleção")
-    col1, col2 = st.columns(2)
+# --- VISÕES DAS PÁGINAS ---
+# Filtros e listas de resultados rodam como fragmentos: mexer em um filtro
+# reexecuta só a visão dele, com o instantâneo e as estatísticas da última
+# execução completa, sem passar de novo por login, carga, barra lateral e
+# edição de álbum. Botões que abrem a edição pedem uma execução completa.
+
+def view(func):
+    """Transforma uma parte da página em fragmento, com perfil próprio quando reexecutada sozinha."""
+    @st.fragment
+    @functools.wraps(func)
+    def fragment():
+        # Durante uma execução completa, o perfil dela já mede o fragmento
+        if profiler is None or profiler.total is None:
+            return func()
+        fragment_profiler = start_run(True, st.session_state.user)
+        fragment_profiler.page = f"{profiler.page} · {func.__name__}"
+        try:
+            return func()
+        finally:
+            fragment_profiler.finish()
+    return fragment
+
+@view
+def library_view():
+    """Busca, filtros, tabela de faixas e médias da Minha Biblioteca."""
+    search_query = st.text_input("🔎 Buscar", placeholder="Título, álbum, artista ou compositor (acentos são opcionais)")
+    col1, col2, col3 = st.columns(3)
     with col1:
-        all_artists_flat = sorted(list(set(item for sublist in df['artists'].dropna().apply(format_string_to_list) for item in sublist)))
+        all_artists_flat = vocab.artists
         selected_artists = st.multiselect("Filtrar por Artista(s)", options=all_artists_flat)
-
-    filtered_df = df.copy()
-    if selected_artists:
-        filtered_df = df[df['artists'].apply(lambda x: any(artist in format_string_to_list(x) for artist in selected_artists))]
-
     with col2:
+        selected_composers = st.multiselect("Filtrar por Compositor(es)", options=vocab.composers)
+
+    mask = None
+    if selected_artists or selected_composers:
+        mask = np.ones(len(df), dtype=bool)
         if selected_artists:
-            available_albums = sorted(map(str, filtered_df['album'].dropna().unique()))
+            mask &= artist_index.mask(selected_artists)
+        if selected_composers:
+            mask &= composer_index.mask(selected_composers)
+
+    with col3:
+        if mask is not None:
+            available_albums = sorted(map(str, df.loc[mask, 'album'].dropna().unique()))
         else:
-            available_albums = sorted(map(str, df['album'].dropna().unique()))
+            available_albums = vocab.albums
         selected_albums = st.multiselect("Filtrar por Álbum(ns)", options=available_albums)
 
     if selected_albums:
-        filtered_df = filtered_df[filtered_df['album'].isin(selected_albums)]
+        album_mask = df['album'].isin(selected_albums).to_numpy()
+        mask = album_mask if mask is None else mask & album_mask
+
+    # Linhas exibidas, como posições (busca) ou máscara (filtros); None mostra tudo
+    selection = mask
+    if search_query.strip():
+        # Resultados da busca em ordem de relevância, dentro dos filtros escolhidos
+        with span("busca"):
+            selection = snapshot.search_index.search(search_query, mask=mask)
+        filtered_df = df.iloc[selection]
+        st.caption(f"{len(filtered_df)} faixas encontradas para \"{search_query.strip()}\"")
+    elif mask is not None:
+        filtered_df = df[mask]
+    else:
+        filtered_df = df
 
     st.dataframe(filtered_df, use_container_width=True)
 
     if not filtered_df.empty:
         st.subheader("Média de Avaliações (Filtro Atual)")
-        avg_cols = st.columns(3)
-        for i, u in enumerate(["jom", "jov", "job"]):
-            avg_rating = filtered_df[f'rating_{u}'].mean()
-            with avg_cols[i]:
+        averages = snapshot.ratings.means(selection)
+        avg_cols = st.columns(len(averages))
+        for col, (u, avg_rating) in zip(avg_cols, averages.items()):
+            with col:
                 st.metric(f"Média {u.upper()}", f"{avg_rating:.2f}" if pd.notna(avg_rating) else "N/A")
 
+
+@view
+def next_to_listen_view():
+    """Filtros e lista paginada dos álbuns em andamento."""
+    f_col1, f_col2 = st.columns(2)
+    all_artists_flat = unique_names(next_to_listen['artists'])
+
+    artist_filter_next = f_col1.multiselect("Filtrar por Artista", options=all_artists_flat, key="artist_next")
+    year_options_next = sorted(next_to_listen['year'].dropna().unique().astype(int))
+    year_filter_next = f_col2.multiselect("Filtrar por Ano", options=year_options_next, key="year_next")
+
+    filtered_next = next_to_listen.copy()
+    if artist_filter_next:
+        filtered_next = filtered_next[filtered_next['artists'].isin(artist_index.strings_for(artist_filter_next))]
+    if year_filter_next:
+        filtered_next = filtered_next[filtered_next['year'].isin(year_filter_next)]
+
+    if filtered_next.empty:
+        st.info("Nenhum álbum para mostrar. Comece a avaliar as músicas de um álbum!")
+    else:
+        for index, row in paginate(filtered_next, "next").iterrows():
+            with st.container(border=True):
+                c1, c2, c3, c4 = st.columns([4, 2, 2, 1])
+                c1.subheader(f"{row['album']}")
+                c1.caption(f"{row['artists']} ({int(row['year'])})")
+                c2.metric("Progresso", f"{row['completion_perc']:.1f}%")
+                c3.metric("Faixas Avaliadas", f"{row['rated_tracks']}/{row['total_tracks']}")
+                if c4.button("✏️", key=f"edit_next_{index}", help="Editar este álbum"):
+                    st.session_state.editing_album = (row['album'], row['artists'])
+                    st.rerun()
+
+
+@view
+def completed_view():
+    """Filtros e galeria paginada dos álbuns concluídos."""
+    fc_col1, fc_col2 = st.columns(2)
+    all_artists_completed = unique_names(completed_albums['artists'])
+
+    artist_filter_completed = fc_col1.multiselect("Filtrar por Artista", options=all_artists_completed, key="artist_completed")
+    year_options_completed = sorted(completed_albums['year'].dropna().unique().astype(int))
+    year_filter_completed = fc_col2.multiselect("Filtrar por Ano", options=year_options_completed, key="year_completed")
+
+    filtered_completed = completed_albums.copy()
+    if artist_filter_completed:
+        filtered_completed = filtered_completed[filtered_completed['artists'].isin(artist_index.strings_for(artist_filter_completed))]
+    if year_filter_completed:
+        filtered_completed = filtered_completed[filtered_completed['year'].isin(year_filter_completed)]
+
+    if filtered_completed.empty:
+        st.info("Você ainda não completou a avaliação de nenhum álbum.")
+    else:
+        for index, row in paginate(filtered_completed, "completed").iterrows():
+            color = get_color_for_rating(row['avg_rating'])
+            label = get_rating_label(row['avg_rating'])
+
+            main_cols = st.columns([10, 1])
+            with main_cols[0]:
+                st.markdown(f"""
+                <div style="border: 2px solid {color}; border-radius: 10px; padding: 15px; height: 100%;">
+                    <div style="display: flex; justify-content: space-between; align-items: center;">
+                        <div>
+                            <h3 style="margin: 0; color: {color};">{row['album']}</h3>
+                            <p style="margin: 0; color: #888;">{row['artists']} ({int(row['year'])})</p>
+                        </div>
+                        <div style="text-align: right;">
+                            <p style="margin: 0; font-size: 1.5em; font-weight: bold; color: {color};">{row['avg_rating']:.2f}</p>
+                            <p style="margin: 0; color: {color};">{label}</p>
+                        </div>
+                    </div>
+                </div>
+                """, unsafe_allow_html=True)
+
+            with main_cols[1]:
+                if st.button("✏️", key=f"edit_comp_{index}", help="Editar este álbum"):
+                    st.session_state.editing_album = (row['album'], row['artists'])
+                    st.rerun()
+
+
+@view
+def album_ranking_view():
+    """Filtros e tabela paginada do ranking de álbuns entre os usuários."""
+    r_col1, r_col2 = st.columns(2)
+    artist_filter_ranking = r_col1.multiselect("Filtrar por Artista", options=unique_names(rankings['artists']), key="artist_ranking")
+    min_raters = r_col2.number_input("Avaliado por pelo menos", min_value=1, max_value=max(1, len(users)), value=1, step=1, key="min_raters")
+
+    filtered_rankings = rankings[rankings['raters'] >= min_raters]
+    if artist_filter_ranking:
+        filtered_rankings = filtered_rankings[filtered_rankings['artists'].isin(artist_index.strings_for(artist_filter_ranking))]
+
+    if filtered_rankings.empty:
+        st.info("Nenhum álbum avaliado para mostrar.")
+    else:
+        st.dataframe(
+            paginate(filtered_rankings, "ranking")[['rank', 'album', 'artists', 'year', 'avg_rating', *users, 'raters', 'total_tracks']],
+            column_config={
+                'rank': st.column_config.NumberColumn("#"),
+                'album': "Álbum",
+                'artists': "Artistas",
+                'year': st.column_config.NumberColumn("Ano", format="%d"),
+                'avg_rating': st.column_config.NumberColumn("Média Geral", format="%.2f"),
+                **{u: st.column_config.NumberColumn(f"Média {u.upper()}", format="%.2f") for u in users},
+                'raters': st.column_config.NumberColumn("Avaliado por"),
+                'total_tracks': st.column_config.NumberColumn("Faixas"),
+            },
+            hide_index=True,
+            use_container_width=True,
+        )
+
+# --- RENDERIZAÇÃO DAS PÁGINAS ---
+phase(f"página: {page}")
+
+if page == "📚 Minha Biblioteca":
+    st.title("📚 Minha Biblioteca")
+    st.header("Explore sua coleção")
+    library_view()
+
 elif page == "➕ Adicionar Dados":
     st.title("➕ Adicionar Dados")
     st.header("Adicionar Novas Músicas ou Álbuns")
-    add_type = st.radio("O que você deseja adicionar?", ("Álbum Inteiro", "Música Avulsa"), horizontal=True)
+    add_type = st.radio("O que você deseja adicionar?", ("Álbum Inteiro", "Música Avulsa", "Importar Arquivo"), horizontal=True)
 
     if add_type == "Álbum Inteiro":
         st.subheader("Informações do Álbum")
-        all_artists_flat = sorted(list(set(item for sublist in df['artists'].dropna().apply(format_string_to_list) for item in sublist)))
+        all_artists_flat = vocab.artists
         album_artists = st.multiselect("Artista(s) do Álbum", options=all_artists_flat, help="Selecione artistas existentes ou digite novos nomes e pressione Enter.")
         new_artist_input = st.text_input("Adicionar novo artista (opcional)", help="Digite um novo nome e adicione na seleção acima.")
         album_title = st.text_input("Título do Álbum")
@@ -258,7 +589,7 @@ elif page == "➕ Adicionar Dados":
         def remove_track(index):
             st.session_state.tracks.pop(index)
 
-        all_composers_flat = sorted(list(set(item for sublist in df['composers'].dropna().apply(format_string_to_list) for item in sublist)))
+        all_composers_flat = vocab.composers
         
         for i, track in enumerate(st.session_state.tracks):
             cols = st.columns([6, 6, 1])
@@ -289,14 +620,13 @@ elif page == "➕ Adicionar Dados":
                             new_row = {
                                 'trackNumber': i + 1, 'title': track['title'], 'artists': format_list_to_string(final_artists),
                                 'album': album_title, 'year': album_year, 'composers': format_list_to_string(track['composers']),
-                                'rating_jom': np.nan, 'rating_jov': np.nan, 'rating_job': np.nan
+                                **{f"rating_{u}": np.nan for u in users}
                             }
                             new_rows.append(new_row)
                     
                     if new_rows:
-                        new_df = pd.DataFrame(new_rows)
-                        df_updated = pd.concat([df, new_df], ignore_index=True)
-                        conn.update(worksheet="Musicas", data=df_updated)
+                        df_updated = with_new_rows(df, new_rows)
+                        persist(df_updated)
                         st.success(f"Álbum '{album_title}' adicionado com sucesso!")
                         st.session_state.tracks = []
                         st.rerun()
@@ -307,12 +637,14 @@ elif page == "➕ Adicionar Dados":
         st.subheader("Informações da Música")
         
         # --- CORREÇÃO DO BUG: Seleção de artista movida para fora do formulário ---
-        all_artists_flat = sorted(list(set(item for sublist in df['artists'].dropna().apply(format_string_to_list) for item in sublist)))
+        all_artists_flat = vocab.artists
         song_artists = st.multiselect("1. Selecione o(s) Artista(s)", options=all_artists_flat)
         
         if song_artists:
-            artist_albums_df = df[df['artists'].apply(lambda x: any(artist in format_string_to_list(x) for artist in song_artists))]
-            album_options = sorted(map(str, artist_albums_df['album'].dropna().unique()))
+            # Álbuns dos artistas escolhidos, com o ano, direto do índice de álbuns
+            albums = snapshot.album_index.table
+            artist_albums = albums[albums.index.get_level_values('artists').isin(artist_index.strings_for(song_artists))]
+            album_options = sorted(map(str, artist_albums.index.get_level_values('album').unique()))
         else:
             album_options = []
 
@@ -325,7 +657,7 @@ elif page == "➕ Adicionar Dados":
                 song_year = st.number_input("Ano", min_value=1900, max_value=2100, step=1)
             else:
                 song_album = album_choice
-                year_val_series = pd.to_numeric(df[df['album'] == song_album]['year'], errors='coerce').dropna()
+                year_val_series = artist_albums.loc[artist_albums.index.get_level_values('album') == song_album, 'year'].dropna()
                 if not year_val_series.empty:
                     year_val = int(year_val_series.iloc[0])
                     song_year = st.number_input("Ano", value=year_val, disabled=True)
@@ -335,7 +667,7 @@ elif page == "➕ Adicionar Dados":
             song_title = st.text_input("Título da Música")
             track_number = st.number_input("Número da Faixa", min_value=1, step=1)
 
-            all_composers_flat = sorted(list(set(item for sublist in df['composers'].dropna().apply(format_string_to_list) for item in sublist)))
+            all_composers_flat = vocab.composers
             song_composers = st.multiselect("Compositor(es)", options=all_composers_flat)
 
             submitted = st.form_submit_button("Salvar Música")
@@ -344,22 +676,54 @@ elif page == "➕ Adicionar Dados":
                 if not song_artists or not song_album or not song_title:
                     st.error("Artista, Álbum e Título são campos obrigatórios.")
                 else:
-                    new_row = pd.DataFrame([{'trackNumber': track_number, 'title': song_title, 'artists': format_list_to_string(song_artists),
-                                             'album': song_album, 'year': song_year, 'composers': format_list_to_string(song_composers),
-                                             'rating_jom': np.nan, 'rating_jov': np.nan, 'rating_job': np.nan}])
-                    df_updated = pd.concat([df, new_row], ignore_index=True)
-                    conn.update(worksheet="Musicas", data=df_updated)
+                    new_row = {'trackNumber': track_number, 'title': song_title, 'artists': format_list_to_string(song_artists),
+                               'album': song_album, 'year': song_year, 'composers': format_list_to_string(song_composers),
+                               **{f"rating_{u}": np.nan for u in users}}
+                    df_updated = with_new_rows(df, [new_row])
+                    persist(df_updated)
                     st.success(f"Música '{song_title}' adicionada com sucesso!")
 
+    if add_type == "Importar Arquivo":
+        st.subheader("Importar Álbuns em Lote")
+        st.markdown(
+            "Envie um **CSV** com uma linha por faixa e as colunas `album`, `artists`, `year`, `title`, "
+            "`trackNumber` e `composers`, ou um **JSON**/**JSON Lines** com álbuns no formato "
+            "`{\"album\": ..., \"artists\": [...], \"year\": ..., \"tracks\": [{\"title\": ..., \"composers\": [...]}]}`. "
+            "Artistas e compositores podem vir em lista ou separados por ';'; faixas sem número seguem a ordem do álbum."
+        )
+        uploaded = st.file_uploader("Arquivo de álbuns", type=["csv", "json", "jsonl"])
+
+        if uploaded is not None:
+            # A validação só é refeita quando o arquivo ou a biblioteca mudam
+            preview_key = (uploaded.file_id, snapshot.number)
+            if st.session_state.get('import_preview', (None,))[0] != preview_key:
+                try:
+                    with span("validação da importação"):
+                        st.session_state.import_preview = (preview_key, read_tracklists(uploaded, uploaded.name, df))
+                except ValueError as e:
+                    st.session_state.import_preview = (preview_key, e)
+            preview = st.session_state.import_preview[1]
+            if isinstance(preview, Exception):
+                st.error(f"Não foi possível ler o arquivo: {preview}")
+            else:
+                import_rows, import_errors, import_total = preview
+                album_count = len(import_rows[['album', 'artists', 'year']].drop_duplicates())
+                st.caption(f"{import_total} faixas lidas · {len(import_rows)} válidas em {album_count} álbuns · {len(import_errors)} problemas")
+                if not import_errors.empty:
+                    st.warning("As faixas com problemas abaixo serão ignoradas.")
+                    st.dataframe(import_errors, hide_index=True, use_container_width=True)
+                if not import_rows.empty:
+                    st.dataframe(import_rows.head(100), hide_index=True, use_container_width=True)
+                    if st.button(f"Importar {len(import_rows)} faixas", type="primary"):
+                        # Todas as faixas entram em uma única gravação
+                        persist(with_new_rows(df, import_rows))
+                        st.success(f"{len(import_rows)} faixas de {album_count} álbuns importadas com sucesso!")
+
 elif page == "🎧 Próximos a Ouvir" or page == "🏆 Álbuns Concluídos":
     # --- LÓGICA COMUM PARA AS PÁGINAS DE ESTATÍSTICAS ---
     if not df.empty:
-        album_stats = df.groupby(['album', 'artists', 'year']).agg(
-            total_tracks=('title', 'count'),
-            rated_tracks=(USER_RATING_COL, lambda x: x.notna().sum()),
-            avg_rating=(USER_RATING_COL, 'mean')
-        ).reset_index()
-        album_stats['completion_perc'] = (album_stats['rated_tracks'] / album_stats['total_tracks']) * 100
+        with span("estatísticas de álbuns"):
+            album_stats = snapshot.album_stats.for_user(st.session_state.user)
     else:
         album_stats = pd.DataFrame()
 
@@ -375,32 +739,7 @@ elif page == "🎧 Próximos a Ouvir" or page == "🏆 Álbuns Concluídos":
         else:
             next_to_listen = pd.DataFrame()
         
-        f_col1, f_col2 = st.columns(2)
-        all_artists_flat = sorted(list(set(item for sublist in next_to_listen['artists'].dropna().apply(format_string_to_list) for item in sublist)))
-        
-        artist_filter_next = f_col1.multiselect("Filtrar por Artista", options=all_artists_flat, key="artist_next")
-        year_options_next = sorted(next_to_listen['year'].dropna().unique().astype(int))
-        year_filter_next = f_col2.multiselect("Filtrar por Ano", options=year_options_next, key="year_next")
-
-        filtered_next = next_to_listen.copy()
-        if artist_filter_next:
-            filtered_next = filtered_next[filtered_next['artists'].apply(lambda x: any(artist in format_string_to_list(x) for artist in artist_filter_next))]
-        if year_filter_next:
-            filtered_next = filtered_next[filtered_next['year'].isin(year_filter_next)]
-
-        if filtered_next.empty:
-            st.info("Nenhum álbum para mostrar. Comece a avaliar as músicas de um álbum!")
-        else:
-            for index, row in filtered_next.iterrows():
-                with st.container(border=True):
-                    c1, c2, c3, c4 = st.columns([4, 2, 2, 1])
-                    c1.subheader(f"{row['album']}")
-                    c1.caption(f"{row['artists']} ({int(row['year'])})")
-                    c2.metric("Progresso", f"{row['completion_perc']:.1f}%")
-                    c3.metric("Faixas Avaliadas", f"{row['rated_tracks']}/{row['total_tracks']}")
-                    if c4.button("✏️", key=f"edit_next_{index}", help="Editar este álbum"):
-                        st.session_state.editing_album = (row['album'], row['artists'])
-                        st.rerun()
+        next_to_listen_view()
 
     elif page == "🏆 Álbuns Concluídos":
         st.title("🏆 Álbuns Concluídos")
@@ -412,44 +751,40 @@ elif page == "🎧 Próximos a Ouvir" or page == "🏆 Álbuns Concluídos":
         else:
             completed_albums = pd.DataFrame()
 
-        fc_col1, fc_col2 = st.columns(2)
-        all_artists_completed = sorted(list(set(item for sublist in completed_albums['artists'].dropna().apply(format_string_to_list) for item in sublist)))
-        
-        artist_filter_completed = fc_col1.multiselect("Filtrar por Artista", options=all_artists_completed, key="artist_completed")
-        year_options_completed = sorted(completed_albums['year'].dropna().unique().astype(int))
-        year_filter_completed = fc_col2.multiselect("Filtrar por Ano", options=year_options_completed, key="year_completed")
-
-        filtered_completed = completed_albums.copy()
-        if artist_filter_completed:
-            filtered_completed = filtered_completed[filtered_completed['artists'].apply(lambda x: any(artist in format_string_to_list(x) for artist in artist_filter_completed))]
-        if year_filter_completed:
-            filtered_completed = filtered_completed[filtered_completed['year'].isin(year_filter_completed)]
-
-        if filtered_completed.empty:
-            st.info("Você ainda não completou a avaliação de nenhum álbum.")
-        else:
-            for index, row in filtered_completed.iterrows():
-                color = get_color_for_rating(row['avg_rating'])
-                label = get_rating_label(row['avg_rating'])
-                
-                main_cols = st.columns([10, 1])
-                with main_cols[0]:
-                    st.markdown(f"""
-                    <div style="border: 2px solid {color}; border-radius: 10px; padding: 15px; height: 100%;">
-                        <div style="display: flex; justify-content: space-between; align-items: center;">
-                            <div>
-                                <h3 style="margin: 0; color: {color};">{row['album']}</h3>
-                                <p style="margin: 0; color: #888;">{row['artists']} ({int(row['year'])})</p>
-                            </div>
-                            <div style="text-align: right;">
-                                <p style="margin: 0; font-size: 1.5em; font-weight: bold; color: {color};">{row['avg_rating']:.2f}</p>
-                                <p style="margin: 0; color: {color};">{label}</p>
-                            </div>
-                        </div>
-                    </div>
-                    """, unsafe_allow_html=True)
-                
-                with main_cols[1]:
-                    if st.button("✏️", key=f"edit_comp_{index}", help="Editar este álbum"):
-                        st.session_state.editing_album = (row['album'], row['artists'])
-                        st.rerun()
+        completed_view()
+
+elif page == "👥 Comparar Notas":
+    st.title("👥 Comparar Notas")
+    st.header("Como as notas de cada um se comparam")
+    with span("estatísticas entre usuários"):
+        agreement = snapshot.ratings.agreement
+        rankings = snapshot.ratings.album_rankings
+
+    st.subheader("Concordância entre Usuários")
+    st.markdown(f"Cada par é comparado só nas faixas que os dois avaliaram; notas a até {AGREEMENT_TOLERANCE:g} ponto uma da outra contam como concordância.")
+    agreement = agreement[agreement['common_tracks'] > 0]
+    if agreement.empty:
+        st.info("Ainda não há faixas avaliadas por mais de um usuário.")
+    else:
+        agreement = agreement.assign(user_a=agreement['user_a'].str.upper(), user_b=agreement['user_b'].str.upper())
+        st.dataframe(
+            agreement,
+            column_config={
+                'user_a': "Usuário",
+                'user_b': "Comparado com",
+                'common_tracks': st.column_config.NumberColumn("Faixas em Comum"),
+                'correlation': st.column_config.NumberColumn("Correlação", format="%.2f"),
+                'mean_difference': st.column_config.NumberColumn("Diferença Média", format="%+.2f", help="Nota do usuário menos a do comparado, em média."),
+                'mean_abs_difference': st.column_config.NumberColumn("Diferença Absoluta Média", format="%.2f"),
+                'agreement_perc': st.column_config.NumberColumn("Concordância", format="%.1f%%"),
+            },
+            hide_index=True,
+            use_container_width=True,
+        )
+
+    st.subheader("Ranking de Álbuns")
+    st.markdown("Álbuns ordenados pela média das notas médias de cada usuário: cada pessoa pesa o mesmo, não importa quantas faixas avaliou.")
+    album_ranking_view()
+
+# --- DIAGNÓSTICO DE DESEMPENHO ---
+finish_profiling()
@@ -0,0 +1,129 @@
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import contextmanager, nullcontext
+from contextvars import ContextVar
+from pathlib import Path
+
+# --- INSTRUMENTAÇÃO DE DESEMPENHO ---
+# Cada execução do script pode ter um perfil com a duração de cada fase e a
+# contagem de leituras e gravações no armazenamento. Sem perfil ativo, `span` e
+# `count_io` apenas consultam uma ContextVar e retornam, sem medir nada.
+
+PERF_LOG = Path(os.environ.get("MUSIC_TRACKER_PERF_LOG", Path(__file__).parent / "logs" / "desempenho.jsonl"))
+
+_current = ContextVar("profiler", default=None)
+_NO_SPAN = nullcontext()
+
+
+class RunProfiler:
+    """Fases cronometradas e operações de E/S de uma execução do script."""
+
+    def __init__(self, user=None, page=None):
+        self.user = user
+        self.page = page
+        self.started_at = time.time()
+        self._start = time.perf_counter()
+        self.spans = []
+        self.io = defaultdict(lambda: {'calls': 0, 'rows': 0, 'cells': 0})
+        self.total = None
+        self._depth = 0
+        self._phase = None
+
+    def _record(self, name, start, depth):
+        self.spans.append({
+            'name': name,
+            'depth': depth,
+            'start_ms': (start - self._start) * 1000,
+            'ms': (time.perf_counter() - start) * 1000,
+        })
+
+    @contextmanager
+    def span(self, name):
+        start = time.perf_counter()
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            self._record(name, start, self._depth)
+
+    def phase(self, name):
+        """Inicia uma fase do script, encerrando a anterior (útil onde não cabe um bloco `with`)."""
+        self._close_phase()
+        self._phase = (name, time.perf_counter())
+        self._depth = 1
+
+    def _close_phase(self):
+        if self._phase is not None:
+            self._record(self._phase[0], self._phase[1], 0)
+            self._phase = None
+            self._depth = 0
+
+    def count_io(self, operation, rows=0, cells=0):
+        entry = self.io[operation]
+        entry['calls'] += 1
+        entry['rows'] += rows
+        entry['cells'] += cells
+
+    def merge_io(self, io, source):
+        """Soma as operações de E/S de outro perfil (ex.: da fila de gravação), marcando a origem."""
+        for operation, entry in io.items():
+            target = self.io[f"{operation} ({source})"]
+            for key, value in entry.items():
+                target[key] += value
+
+    def finish(self, interrupted=False):
+        """Encerra o perfil e grava uma linha JSON no log de desempenho."""
+        self._close_phase()
+        self.total = (time.perf_counter() - self._start) * 1000
+        self.spans.sort(key=lambda s: s['start_ms'])
+        record = {
+            'timestamp': time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started_at)),
+            'user': self.user,
+            'page': self.page,
+            'total_ms': round(self.total, 3),
+            'interrupted': interrupted,
+            'spans': [{**s, 'start_ms': round(s['start_ms'], 3), 'ms': round(s['ms'], 3)} for s in self.spans],
+            'io': dict(self.io),
+        }
+        try:
+            PERF_LOG.parent.mkdir(parents=True, exist_ok=True)
+            with PERF_LOG.open("a", encoding="utf-8") as log:
+                log.write(json.dumps(record, ensure_ascii=False) + "\n")
+        except OSError:
+            pass
+        return record
+
+
+def start_run(enabled, user=None):
+    """Ativa um perfil para a execução atual (ou nenhum, se desativado) e o retorna."""
+    profiler = RunProfiler(user) if enabled else None
+    _current.set(profiler)
+    return profiler
+
+
+def profiling_active():
+    """Indica se a execução atual tem um perfil ativo."""
+    return _current.get() is not None
+
+
+def span(name):
+    """Cronometra um trecho na execução atual; sem perfil ativo não faz nada."""
+    profiler = _current.get()
+    return profiler.span(name) if profiler is not None else _NO_SPAN
+
+
+def phase(name):
+    """Marca o início de uma fase na execução atual; sem perfil ativo não faz nada."""
+    profiler = _current.get()
+    if profiler is not None:
+        profiler.phase(name)
+
+
+def count_io(operation, rows=0, cells=0):
+    """Contabiliza uma chamada de leitura ou gravação no armazenamento."""
+    profiler = _current.get()
+    if profiler is not None:
+        profiler.count_io(operation, rows, cells)
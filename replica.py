@@ -0,0 +1,105 @@
+import json
+import os
+import tempfile
+from pathlib import Path
+
+import pandas as pd
+
+from armazenamento import WORKSHEET, prepare_dataframe
+from instrumentacao import count_io, span
+
+# --- RÉPLICA LOCAL DA PLANILHA ---
+# Guarda em disco (Parquet) o DataFrame já tratado, junto com a versão da
+# planilha da qual ele foi lido. A planilha só é relida quando a versão remota
+# (data de modificação informada pelo Drive) for diferente da versão da réplica.
+
+REPLICA_DIR = Path(os.environ.get("MUSIC_TRACKER_REPLICA_DIR", Path(__file__).parent / ".replica"))
+
+
+def _replica_paths(worksheet=WORKSHEET, directory=REPLICA_DIR):
+    return directory / f"{worksheet}.parquet", directory / f"{worksheet}.json"
+
+
+def sheet_version(conn, worksheet=WORKSHEET):
+    """Retorna a data da última modificação da planilha, ou None se não for possível consultá-la."""
+    count_io('sheet_version')
+    try:
+        return conn.client._select_worksheet(worksheet=worksheet).spreadsheet.get_lastUpdateTime()
+    except Exception:
+        return None
+
+
+def replica_version(worksheet=WORKSHEET, directory=REPLICA_DIR):
+    """Retorna a versão da planilha gravada na réplica local, ou None se não houver réplica."""
+    _, meta_path = _replica_paths(worksheet, directory)
+    try:
+        return json.loads(meta_path.read_text())['version']
+    except (OSError, ValueError, KeyError):
+        return None
+
+
+def read_replica(worksheet=WORKSHEET, directory=REPLICA_DIR):
+    """Lê o DataFrame tratado da réplica local."""
+    data_path, _ = _replica_paths(worksheet, directory)
+    df = pd.read_parquet(data_path)
+    count_io('replica_read', rows=len(df))
+    return df
+
+
+def store_replica(df, version, worksheet=WORKSHEET, directory=REPLICA_DIR):
+    """Grava o DataFrame e a versão na réplica, substituindo os arquivos de forma atômica."""
+    data_path, meta_path = _replica_paths(worksheet, directory)
+    directory.mkdir(parents=True, exist_ok=True)
+
+    # Nome temporário único: a sessão que recarrega e a fila de gravação podem gravar ao mesmo tempo
+    with tempfile.NamedTemporaryFile(dir=directory, suffix=".tmp", delete=False) as tmp_data:
+        df.to_parquet(tmp_data)
+    os.replace(tmp_data.name, data_path)
+
+    with tempfile.NamedTemporaryFile("w", dir=directory, suffix=".tmp", delete=False) as tmp_meta:
+        tmp_meta.write(json.dumps({'version': version, 'rows': len(df)}))
+    os.replace(tmp_meta.name, meta_path)
+
+
+def _read_sheet(conn, worksheet, ttl):
+    """Lê a aba inteira, com uma coluna de nota por usuário, e converte os tipos das colunas."""
+    with span("leitura da planilha"):
+        raw = conn.read(worksheet=worksheet, ttl=ttl)
+    count_io('sheet_read', rows=len(raw), cells=raw.size)
+    with span("conversão de tipos"):
+        return prepare_dataframe(raw)
+
+
+def load_library(conn, version, worksheet=WORKSHEET):
+    """Carrega a biblioteca da réplica local e só relê a planilha quando a versão mudou.
+
+    Sem versão remota (cliente sem acesso ao Drive) a planilha é lida como antes,
+    com o cache curto da conexão.
+    """
+    if version is None:
+        return _read_sheet(conn, worksheet, ttl=5)
+
+    if replica_version(worksheet) == version:
+        try:
+            with span("leitura da réplica"):
+                return read_replica(worksheet)
+        except Exception:
+            pass
+
+    df = _read_sheet(conn, worksheet, ttl=0)
+    try:
+        store_replica(df, version, worksheet)
+    except Exception:
+        pass # A réplica é só um atalho; sem ela a planilha é relida na próxima mudança
+    return df
+
+
+def record_write(conn, df, worksheet=WORKSHEET):
+    """Atualiza a réplica após uma gravação nossa e retorna a nova versão da planilha."""
+    version = sheet_version(conn, worksheet)
+    if version is not None:
+        try:
+            store_replica(df, version, worksheet)
+        except Exception:
+            return None
+    return version
@@ -0,0 +1,44 @@
+import os
+import sys
+import tempfile
+from pathlib import Path
+
+# Os módulos do app ficam na raiz do repositório
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+# Réplica local e log de desempenho em um diretório temporário, fora da árvore do projeto
+_tmp = Path(tempfile.mkdtemp(prefix="music-tracker-tests-"))
+os.environ.setdefault("MUSIC_TRACKER_REPLICA_DIR", str(_tmp / "replica"))
+os.environ.setdefault("MUSIC_TRACKER_PERF_LOG", str(_tmp / "desempenho.jsonl"))
+
+import pytest  # noqa: E402
+
+import fila_gravacao  # noqa: E402
+from backends import GSheetsBackend  # noqa: E402
+from benchmarks.conexao_falsa import FakeGSheetsConnection  # noqa: E402
+from benchmarks.gerador import generate_library  # noqa: E402
+from compartilhado import SharedLibrary  # noqa: E402
+
+
+@pytest.fixture
+def raw_library():
+    """Biblioteca sintética pequena no formato da aba "Musicas"."""
+    return generate_library(60, seed=1)
+
+
+@pytest.fixture
+def make_library(monkeypatch):
+    """Cria bibliotecas compartilhadas sobre uma conexão falsa, com a fila gravando sem esperar por mais alterações."""
+    monkeypatch.setattr(fila_gravacao, 'COALESCE_WINDOW_S', 0.01)
+    return lambda raw: SharedLibrary(GSheetsBackend(FakeGSheetsConnection(raw)))
+
+
+@pytest.fixture
+def library(make_library, raw_library):
+    return make_library(raw_library)
+
+
+def plain(df):
+    """Valores do DataFrame como listas de objetos, com nulos como None, para comparar com a aba."""
+    df = df.reset_index(drop=True).astype(object)
+    return df.where(df.notna(), None).values.tolist()
@@ -0,0 +1,164 @@
+import pandas as pd
+import pytest
+
+from armazenamento import prepare_dataframe, save_changes, set_cells, with_new_rows
+from benchmarks.conexao_falsa import FakeGSheetsConnection
+from conftest import plain
+
+
+@pytest.fixture
+def conn(raw_library):
+    return FakeGSheetsConnection(raw_library)
+
+
+@pytest.fixture
+def original(conn):
+    return prepare_dataframe(conn.read())
+
+
+def record_ranges(conn, monkeypatch):
+    """Intervalos A1 enviados em cada chamada de batch_update da aba."""
+    sent = []
+    batch_update = conn.worksheet.batch_update
+
+    def recording(data, **kwargs):
+        sent.append([entry['range'] for entry in data])
+        return batch_update(data, **kwargs)
+
+    monkeypatch.setattr(conn.worksheet, 'batch_update', recording)
+    return sent
+
+
+@pytest.fixture
+def ranges(conn, monkeypatch):
+    return record_ranges(conn, monkeypatch)
+
+
+def test_changed_cells_send_only_their_ranges(conn, original, ranges):
+    updated = original.copy()
+    set_cells(updated, [1, 2], 'rating_jom', [8.5, 9.0])
+    set_cells(updated, [5], 'title', ["Outra"])
+
+    result = save_changes(conn, original, updated)
+
+    assert ranges == [["G3:G4", "B7:B7"]]
+    assert conn.calls['batch_update'] == 1 and conn.calls['update'] == 0
+    assert plain(conn.worksheet.data) == plain(updated)
+    assert result.index.equals(updated.index)
+
+
+def test_appended_rows_grow_the_grid(conn, original, ranges):
+    new_rows = [
+        dict(trackNumber=1, title="Nova 1", artists="Ana", album="Novo", year=2020, composers="Ana"),
+        dict(trackNumber=2, title="Nova 2", artists="Ana", album="Novo", year=2020, composers="Ana", rating_jov=7.5),
+    ]
+    updated = with_new_rows(original, new_rows)
+
+    result = save_changes(conn, original, updated)
+
+    assert ranges == [[f"A{len(original) + 2}:I{len(original) + 3}"]]
+    assert conn.calls['add_rows'] == 1 and conn.calls['update'] == 0
+    assert plain(conn.worksheet.data) == plain(updated)
+    assert list(result.index[-2:]) == [len(original), len(original) + 1]
+
+
+def test_removed_rows_are_deleted_and_labels_shift(conn, original, ranges):
+    updated = original.drop(index=[1, 2, 10])
+    set_cells(updated, [4], 'rating_job', [6.0])
+
+    result = save_changes(conn, original, updated)
+
+    assert ranges == [["I6:I6"]]
+    assert conn.calls['delete'] == 1 and conn.calls['update'] == 0
+    assert plain(conn.worksheet.data) == plain(updated)
+    assert result.index.equals(pd.RangeIndex(len(updated)))
+    assert result.at[2, 'rating_job'] == 6.0  # a linha de rótulo 4 sobe duas posições
+
+
+def test_incompatible_columns_rewrite_the_sheet(conn, original, ranges):
+    updated = original.drop(columns='composers')
+
+    result = save_changes(conn, original, updated)
+
+    assert conn.calls['update'] == 1 and ranges == []
+    assert list(conn.worksheet.data.columns) == list(updated.columns)
+    assert plain(result) == plain(updated)
+
+
+def test_client_without_worksheet_access_rewrites_the_sheet(conn, original):
+    conn.client = object()
+    updated = original.copy()
+    set_cells(updated, [0], 'rating_jom', [10.0])
+
+    save_changes(conn, original, updated)
+
+    assert conn.calls['update'] == 1 and conn.calls['batch_update'] == 0
+    assert plain(conn.worksheet.data) == plain(updated)
+
+
+def test_api_errors_propagate_without_rewrite(conn, original, monkeypatch):
+    def rate_limited(*args, **kwargs):
+        raise RuntimeError("429: quota exceeded")
+
+    monkeypatch.setattr(conn.worksheet, 'batch_update', rate_limited)
+    updated = original.copy()
+    set_cells(updated, [0], 'rating_jom', [10.0])
+
+    with pytest.raises(RuntimeError):
+        save_changes(conn, original, updated)
+    assert conn.calls['update'] == 0
+
+
+@pytest.fixture
+def conn_with_extra_columns(raw_library):
+    """Aba com uma coluna que o app não lê entre as colunas da faixa e as de nota, e um usuário a mais no fim."""
+    raw = raw_library.copy()
+    raw.insert(6, 'notas', [f"nota {i}" for i in range(len(raw))])
+    raw['rating_ana'] = float('nan')
+    return FakeGSheetsConnection(raw)
+
+
+def test_cells_are_written_under_their_sheet_header(conn_with_extra_columns):
+    conn = conn_with_extra_columns
+    original = prepare_dataframe(conn.read())
+    assert 'notas' not in original.columns
+    updated = original.copy()
+    set_cells(updated, [2], 'rating_ana', [8.0])
+    set_cells(updated, [3], 'composers', ["Ana"])
+    set_cells(updated, [3], 'rating_jom', [5.5])
+
+    save_changes(conn, original, updated)
+
+    sheet = conn.worksheet.data
+    assert conn.calls['update'] == 0
+    assert sheet.at[2, 'rating_ana'] == 8
+    assert sheet.at[3, 'composers'] == "Ana" and sheet.at[3, 'rating_jom'] == 5.5
+    assert sheet['notas'].tolist() == [f"nota {i}" for i in range(len(sheet))]
+
+
+def test_appended_rows_skip_columns_the_app_does_not_read(conn_with_extra_columns, monkeypatch):
+    conn = conn_with_extra_columns
+    ranges = record_ranges(conn, monkeypatch)
+    original = prepare_dataframe(conn.read())
+    updated = with_new_rows(original, [
+        dict(trackNumber=1, title="Nova", artists="Ana", album="Novo", year=2020, composers="Ana", rating_ana=9.0),
+    ])
+
+    save_changes(conn, original, updated)
+
+    row = len(original) + 2
+    assert ranges == [[f"A{row}:F{row}", f"H{row}:K{row}"]]
+    new_row = conn.worksheet.data.iloc[-1]
+    assert new_row['title'] == "Nova" and new_row['rating_ana'] == 9 and new_row.isna()['notas']
+
+
+def test_column_missing_from_header_rewrites_the_sheet(raw_library):
+    conn = FakeGSheetsConnection(raw_library.drop(columns='rating_job'))
+    original = prepare_dataframe(conn.read())  # a coluna de um usuário garantido é criada vazia
+    updated = original.copy()
+    set_cells(updated, [0], 'rating_job', [7.0])
+
+    save_changes(conn, original, updated)
+
+    assert conn.calls['update'] == 1 and conn.calls['batch_update'] == 0
+    assert conn.worksheet.data.at[0, 'rating_job'] == 7
@@ -0,0 +1,46 @@
+import numpy as np
+import pytest
+
+from armazenamento import prepare_dataframe, set_cells, with_new_rows
+from backends import SQLiteBackend
+from conftest import plain
+
+
+@pytest.fixture
+def backend(tmp_path):
+    return SQLiteBackend(tmp_path / "biblioteca.db")
+
+
+def test_replace_all_round_trip(backend, raw_library):
+    df = prepare_dataframe(raw_library)
+    assert backend.is_empty()
+
+    backend.replace_all(df)
+
+    assert not backend.is_empty()
+    loaded = backend.load(backend.version())
+    assert list(loaded.columns) == list(df.columns)
+    assert loaded.index.equals(df.index)
+    assert plain(loaded) == plain(df)
+
+
+def test_save_round_trip(backend, raw_library):
+    backend.replace_all(prepare_dataframe(raw_library))
+    version = backend.version()
+    original = backend.load(version)
+
+    updated = original.drop(index=[3, 4])
+    set_cells(updated, [0, 7], 'rating_jom', [9.5, np.nan])
+    set_cells(updated, [8], 'album', ["Outro Álbum"])
+    updated = with_new_rows(updated, [
+        dict(trackNumber=1, title="Nova", artists="Ana; Bia", album="Novo", year=2021, composers="Bia",
+             rating_jov=8.0),
+    ])
+
+    saved, new_version = backend.save(original, updated)
+
+    assert new_version == version + 1 == backend.version()
+    loaded = backend.load(new_version)
+    assert list(loaded.columns) == list(updated.columns)
+    assert loaded.index.equals(updated.index)
+    assert plain(loaded) == plain(updated) == plain(saved)
@@ -0,0 +1,48 @@
+import numpy as np
+
+from armazenamento import prepare_dataframe, set_cells
+
+
+def _rate(snapshot, label, user, rating):
+    updated = snapshot.df.copy()
+    set_cells(updated, [label], f'rating_{user}', [rating])
+    return updated
+
+
+def test_sessions_saving_from_the_same_snapshot_keep_both_edits(library):
+    start = library.current(library.backend.version())
+
+    library.save(start, _rate(start, 0, 'jom', 9.0), 'jom')
+    library.save(start, _rate(start, 5, 'jov', 7.5), 'jov')  # sessão que ainda via o instantâneo inicial
+
+    published = library.current(library.backend.version()).df
+    assert published.at[0, 'rating_jom'] == 9.0
+    assert published.at[5, 'rating_jov'] == 7.5
+
+    assert library.writer.wait_idle(timeout=10)
+    snapshot = library.current(library.backend.version())
+    assert snapshot.df.at[0, 'rating_jom'] == 9.0
+    assert snapshot.df.at[5, 'rating_jov'] == 7.5
+    sheet = prepare_dataframe(library.backend.conn.read())
+    assert sheet.at[0, 'rating_jom'] == 9.0
+    assert sheet.at[5, 'rating_jov'] == 7.5
+
+    # Uma nova edição da mesma célula não é tratada como conflito
+    edit_id = library.save(snapshot, _rate(snapshot, 0, 'jom', 6.0), 'jom')
+    assert library.writer.wait_idle(timeout=10)
+    assert library.writer.take(edit_id).status == 'saved'
+    assert library.current(library.backend.version()).df.at[0, 'rating_jom'] == 6.0
+
+
+def test_rows_without_album_or_artists_load_and_save(raw_library, make_library):
+    raw = raw_library.copy()
+    raw.loc[3, 'album'] = np.nan
+    raw.loc[7, 'artists'] = np.nan
+    library = make_library(raw)
+
+    snapshot = library.current(library.backend.version())
+    assert len(snapshot.df) == len(raw)
+    library.save(snapshot, _rate(snapshot, 3, 'jom', 8.0), 'jom')
+
+    assert library.writer.wait_idle(timeout=10)
+    assert library.current(library.backend.version()).df.at[3, 'rating_jom'] == 8.0
@@ -0,0 +1,110 @@
+import json
+import logging
+
+import pandas as pd
+import pytest
+
+import fila_gravacao
+from armazenamento import FIRST_DATA_ROW, set_cells
+from conftest import plain
+from instrumentacao import PERF_LOG, start_run
+
+
+def _save_rating(library, rating):
+    snapshot = library.current(library.backend.version())
+    updated = snapshot.df.copy()
+    set_cells(updated, [0], 'rating_jom', [rating])
+    return library.save(snapshot, updated, 'jom')
+
+
+def test_flush_waits_for_pending_edits(library):
+    edit_id = _save_rating(library, 8.0)
+
+    assert library.writer.flush(timeout=10)
+    assert library.writer.take(edit_id).status == 'saved'
+    assert library.backend.conn.worksheet.data.at[0, 'rating_jom'] == 8
+
+
+def test_flush_logs_edits_left_unsaved(library, monkeypatch, caplog):
+    monkeypatch.setattr(fila_gravacao, 'MAX_ATTEMPTS', 2)
+    monkeypatch.setattr(fila_gravacao, 'BACKOFF_S', 0.5)
+
+    def unavailable(original, updated):
+        raise ConnectionError("sem rede")
+
+    monkeypatch.setattr(library.backend, 'save', unavailable)
+    edit_id = _save_rating(library, 8.0)
+
+    with caplog.at_level(logging.ERROR, logger='fila_gravacao'):
+        assert not library.writer.flush(timeout=0.1)
+    assert f"Alteração {edit_id} (usuário jom) não gravada" in caplog.text
+
+    assert library.writer.wait_idle(timeout=10)
+    assert library.writer.take(edit_id).status == 'failed'
+
+
+def _delete_sheet_rows(conn, label):
+    """Remove a linha de rótulo `label` direto na aba, como alguém editando a planilha."""
+    start = label + FIRST_DATA_ROW - 1
+    conn.worksheet.spreadsheet.batch_update({'requests': [
+        {'deleteDimension': {'range': {'sheetId': 0, 'dimension': 'ROWS', 'startIndex': start, 'endIndex': start + 1}}},
+    ]})
+
+
+def test_edit_follows_its_track_after_an_outside_row_deletion(library):
+    snapshot = library.current(library.backend.version())
+    updated = snapshot.df.copy()
+    set_cells(updated, [5], 'rating_jom', [8.0])
+    conn = library.backend.conn
+    expected = conn.worksheet.data.drop(index=0).reset_index(drop=True)
+    expected.at[4, 'rating_jom'] = 8  # a faixa do rótulo 5 sobe uma linha na aba
+    _delete_sheet_rows(conn, 0)
+
+    edit_id = library.save(snapshot, updated, 'jom')
+
+    assert library.writer.wait_idle(timeout=10)
+    assert library.writer.take(edit_id).status == 'saved'
+    assert plain(conn.worksheet.data) == plain(expected)
+    current = library.current(library.backend.version()).df
+    assert current.at[4, 'title'] == snapshot.df.at[5, 'title'] and current.at[4, 'rating_jom'] == 8.0
+
+
+def test_edit_of_a_track_deleted_outside_is_rejected(library):
+    snapshot = library.current(library.backend.version())
+    updated = snapshot.df.copy()
+    set_cells(updated, [5], 'rating_jom', [8.0])
+    conn = library.backend.conn
+    before = conn.worksheet.data.drop(index=5).reset_index(drop=True)
+    _delete_sheet_rows(conn, 5)
+
+    edit_id = library.save(snapshot, updated, 'jom')
+
+    assert library.writer.wait_idle(timeout=10)
+    edit = library.writer.take(edit_id)
+    assert edit.status == 'conflict' and edit.rejected == [(5, 'rating_jom')]
+    pd.testing.assert_frame_equal(conn.worksheet.data, before)
+
+
+def test_profiled_edit_records_the_batch_writes(library):
+    try:
+        start_run(True, 'jom')
+        edit_id = _save_rating(library, 8.0)
+    finally:
+        start_run(False)
+
+    assert library.writer.wait_idle(timeout=10)
+    edit = library.writer.take(edit_id)
+    assert edit.status == 'saved'
+    io = edit.profile['io']
+    assert edit.profile['page'] == "fila de gravação" and edit.profile['user'] == 'jom'
+    assert io['sheet_batch_update']['calls'] == 1 and io['sheet_batch_update']['cells'] == 1
+    assert {'sheet_version', 'sheet_header'} <= set(io)
+    logged = [json.loads(line) for line in PERF_LOG.read_text(encoding="utf-8").splitlines()]
+    assert any(entry['page'] == "fila de gravação" and 'sheet_batch_update' in entry['io'] for entry in logged)
+
+
+def test_unprofiled_edit_has_no_profile(library):
+    edit_id = _save_rating(library, 8.0)
+
+    assert library.writer.wait_idle(timeout=10)
+    assert library.writer.take(edit_id).profile is None
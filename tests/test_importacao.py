@@ -0,0 +1,130 @@
+import io
+import json
+
+import pandas as pd
+import pytest
+
+import importacao
+from armazenamento import COLUMNS, prepare_dataframe
+from conftest import plain
+from importacao import read_tracklists
+
+
+@pytest.fixture
+def existing():
+    return prepare_dataframe(pd.DataFrame([
+        dict(trackNumber=1, title="Antiga", artists="Ana", album="Velho", year=2000, composers="Ana"),
+    ], columns=COLUMNS))
+
+
+def _csv(text):
+    return io.BytesIO(text.encode("utf-8"))
+
+
+def _problems(errors):
+    return list(zip(errors['Faixa do arquivo'], errors['Problema']))
+
+
+def test_required_fields_and_year_range(existing):
+    file = _csv(
+        "album,artists,year,title,trackNumber\n"
+        "Novo,Bia,2001,Um,1\n"
+        ",Bia,2001,Sem álbum,2\n"
+        "Novo,,2001,Sem artistas,3\n"
+        "Novo,Bia,,Sem ano,4\n"
+        "Novo,Bia,2001,,5\n"
+        "Novo,Bia,1899,Antes,6\n"
+        "Novo,Bia,2101,Depois,7\n"
+        "Novo,Bia,2000.5,Fração,8\n"
+        "Novo,Bia,2100,No limite,9\n"
+    )
+
+    rows, errors, total = read_tracklists(file, "faixas.csv", existing)
+
+    assert total == 9
+    assert rows['title'].tolist() == ["Um", "No limite"]
+    assert _problems(errors) == [
+        (2, "Campo obrigatório vazio ou inválido: album"),
+        (3, "Campo obrigatório vazio ou inválido: artists"),
+        (4, "Campo obrigatório vazio ou inválido: year"),
+        (5, "Campo obrigatório vazio ou inválido: title"),
+        (6, "Ano fora do intervalo 1900–2100"),
+        (7, "Ano fora do intervalo 1900–2100"),
+        (8, "Ano fora do intervalo 1900–2100"),
+    ]
+
+
+def test_duplicates_against_library_and_file_across_chunks(existing, monkeypatch):
+    monkeypatch.setattr(importacao, 'IMPORT_CHUNK_ROWS', 2)
+    file = _csv(
+        "album,artists,year,title,trackNumber\n"
+        "Velho,Ana,2000,Repetida da biblioteca,1\n"
+        "Velho,Ana,2000,Nova do álbum antigo,2\n"
+        "Novo,Bia,2001,Um,1\n"
+        "Novo,Bia,2001,Outro um,1\n"  # mesmo número no mesmo bloco
+        "Novo,Bia,2001,Um de novo,1\n"  # e em outro bloco
+    )
+
+    rows, errors, total = read_tracklists(file, "faixas.csv", existing)
+
+    assert total == 5
+    assert rows['title'].tolist() == ["Nova do álbum antigo", "Um"]
+    assert _problems(errors) == [
+        (1, "Faixa já existe na biblioteca (mesmo álbum, artistas e número)"),
+        (4, "Faixa repetida no arquivo (mesmo álbum, artistas e número)"),
+        (5, "Faixa repetida no arquivo (mesmo álbum, artistas e número)"),
+    ]
+
+
+def test_track_numbering_continues_across_chunks(existing, monkeypatch):
+    monkeypatch.setattr(importacao, 'IMPORT_CHUNK_ROWS', 2)
+    file = _csv(
+        "album,artists,year,title\n"
+        "Novo,Bia,2001,Um\n"
+        "Outro,Caio,1999,Primeira\n"
+        "Novo,Bia,2001,Dois\n"
+        "Novo,Bia,2001,Três\n"
+        "Outro,Caio,1999,Segunda\n"
+    )
+
+    rows, errors, total = read_tracklists(file, "faixas.csv", existing)
+
+    assert errors.empty and total == 5
+    numbers = dict(zip(rows['title'], rows['trackNumber']))
+    assert numbers == {"Um": 1, "Dois": 2, "Três": 3, "Primeira": 1, "Segunda": 2}
+
+
+def test_names_are_normalized(existing):
+    file = _csv(
+        "album,artists,year,title,trackNumber,composers\n"
+        "Novo, Bia ;Ana;; Bia,2001,Um,1,  Caio ; ;Caio\n"
+    )
+
+    rows, errors, total = read_tracklists(file, "faixas.csv", existing)
+
+    assert errors.empty
+    assert rows.loc[0, ['artists', 'composers']].tolist() == ["Bia; Ana", "Caio"]
+
+
+def test_json_albums_and_jsonl_tracks(existing):
+    albums = {"albums": [{
+        "album": "Novo", "artists": ["Bia", " Ana "], "year": 2001,
+        "tracks": ["Um", {"title": "Dois", "composers": ["Caio", "Caio"]}],
+    }]}
+    tracks = "\n".join(json.dumps(track) for track in [
+        {"album": "Solto", "artists": "Caio", "year": 1999, "title": "A", "trackNumber": 5},
+        {"album": "Solto", "artists": "Caio", "year": 1899, "title": "B"},
+        {"album": "Solto", "artists": "Caio", "year": 1999, "title": "C"},
+    ])
+
+    rows, errors, total = read_tracklists(io.BytesIO(json.dumps(albums).encode()), "albuns.json", existing)
+    assert errors.empty and total == 2
+    assert plain(rows[['trackNumber', 'title', 'artists', 'composers']]) == [
+        [1, "Um", "Bia; Ana", None],
+        [2, "Dois", "Bia; Ana", "Caio"],
+    ]
+
+    rows, errors, total = read_tracklists(io.BytesIO(tracks.encode()), "faixas.jsonl", existing)
+    assert total == 3
+    assert rows[['title', 'trackNumber']].values.tolist() == [["A", 5], ["C", 3]]  # C é a terceira do álbum
+    assert _problems(errors) == [(2, "Ano fora do intervalo 1900–2100")]
@@ -0,0 +1,143 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from armazenamento import compute_changes, prepare_dataframe, set_cells
+from indices import AlbumIndex, AlbumStats, Membership, Vocabulary
+
+
+@pytest.fixture
+def library(raw_library):
+    raw = raw_library.copy()
+    raw.loc[3, 'album'] = np.nan
+    raw.loc[[7, 20], 'artists'] = np.nan
+    return prepare_dataframe(raw)
+
+
+def _expected_positions(df):
+    keys = df[['album', 'artists']].astype(object)
+    complete = keys.notna().all(axis=1).to_numpy()
+    expected = {}
+    for position, key in enumerate(keys.itertuples(index=False, name=None)):
+        if complete[position]:
+            expected.setdefault(key, []).append(position)
+    return expected
+
+
+def _assert_matches(index, df):
+    expected = _expected_positions(df)
+    assert set(map(tuple, index.table.index)) == set(expected)
+    for key, positions in expected.items():
+        assert index.positions(*key).tolist() == positions
+        assert index.table.loc[key, 'tracks'] == len(positions)
+        years = df['year'].iloc[positions].dropna()
+        assert index.year(*key) == years.iloc[0]
+
+
+def test_rows_without_album_or_artists_belong_to_no_album(library):
+    index = AlbumIndex(library)
+
+    _assert_matches(index, library)
+    listed = np.concatenate([index.positions(*key) for key in index.table.index])
+    assert not {3, 7, 20} & set(listed.tolist())
+
+
+def test_apply_changes_matches_a_rebuild(library):
+    index = AlbumIndex(library)
+    updated = library.copy()
+    album, artists = library.at[0, 'album'], library.at[0, 'artists']
+    set_cells(updated, [3, 7], 'album', [album, album])  # linhas sem chave entram no álbum
+    set_cells(updated, [7], 'artists', [artists])
+    set_cells(updated, [1], 'album', [np.nan])  # e uma sai de todos
+    set_cells(updated, [2], 'year', [1900])
+
+    changed, added, removed = compute_changes(library, updated, list(library.columns))
+    new_index = index.copy()
+    new_index.apply_changes(updated, library.loc[changed.index], prepare_dataframe(pd.concat([changed, added])))
+
+    _assert_matches(new_index, updated)
+    _assert_matches(index, library)  # o índice original não muda
+
+
+def test_album_stats_apply_changes_matches_a_rebuild(library):
+    stats = AlbumStats(library)
+    updated = library.copy()
+    set_cells(updated, [0, 1], 'rating_jom', [7.5, np.nan])
+    album = library['album'] == library.at[5, 'album']
+    set_cells(updated, library.index[album], 'album', "Álbum novo")  # um álbum some e outro surge
+    set_cells(updated, [9], 'year', [1901])
+
+    changed, added, removed = compute_changes(library, updated, list(library.columns))
+    new_stats = stats.copy()
+    new_stats.apply_changes(library.loc[changed.index], prepare_dataframe(pd.concat([changed, added])))
+
+    expected = AlbumStats(updated).for_user('jom')
+    result = new_stats.for_user('jom')
+    assert list(result.columns) == list(expected.columns)
+    pd.testing.assert_frame_equal(
+        result.astype({'album': object}).sort_values(['album', 'artists', 'year'], ignore_index=True),
+        expected.astype({'album': object}).sort_values(['album', 'artists', 'year'], ignore_index=True),
+        check_dtype=False, check_index_type=False,
+    )
+
+
+def test_vocabulary_apply_changes_matches_a_rebuild(library):
+    vocab = Vocabulary(library)
+    assert vocab.artists and vocab.composers and vocab.albums and vocab.years  # listas já ordenadas
+    updated = library.copy()
+    set_cells(updated, [0, 1], 'artists', ["Nome Novo; " + library.at[0, 'artists']] * 2)
+    set_cells(updated, [2], 'composers', ["C. Único"])
+    set_cells(updated, [5, 6], 'album', ["Álbum Novo"] * 2)
+    set_cells(updated, [8], 'year', [1901])
+
+    changed, added, removed = compute_changes(library, updated, list(library.columns))
+    new_vocab = vocab.copy()
+    new_vocab.apply_changes(library.loc[changed.index], prepare_dataframe(pd.concat([changed, added])))
+
+    rebuilt = Vocabulary(updated)
+    assert new_vocab.counts == rebuilt.counts
+    for field in ('artists', 'composers', 'albums', 'years'):
+        assert getattr(new_vocab, field) == getattr(rebuilt, field)
+    assert "Nome Novo" in new_vocab.artists and "Nome Novo" not in vocab.artists
+
+
+MESSY_NAMES = [
+    "Ana; Bia", " Ana ;  Bia ", "Ana; Ana", "Ana;;Bia", ";", "", np.nan, "Bia; ", "  ", "Caio;Ana", "Bia",
+    "Ana Bia", "ana",
+]
+
+
+def format_string_to_list(data_string):
+    """Separação usada pelos filtros da página antes do índice (cópia de inicio.py)."""
+    if isinstance(data_string, str):
+        return [item.strip() for item in data_string.split(';')]
+    return []
+
+
+def _string_filter(series, names):
+    return series.apply(lambda x: any(name in format_string_to_list(x) for name in names)).to_numpy(dtype=bool)
+
+
+@pytest.mark.parametrize('as_category', [False, True])
+def test_membership_matches_string_splitting(as_category):
+    series = pd.Series(MESSY_NAMES * 2, dtype=object)
+    index = Membership(series.astype('category') if as_category else series)
+
+    for names in (["Ana"], ["Bia"], ["Caio", "Bia"], [""], ["Ana Bia"], ["ana"], ["Nenhum"], []):
+        expected = _string_filter(series, names)
+        assert (index.mask(names) == expected).all(), names
+        assert set(index.strings_for(names)) == set(series[expected]), names
+
+
+def test_membership_refresh_matches_string_splitting():
+    series = pd.Series(MESSY_NAMES, dtype='category')
+    index = Membership(series)
+    updated = series.cat.add_categories(["Dora ;Ana", " Eva"])
+    updated[[0, 4]] = ["Dora ;Ana", " Eva"]
+
+    refreshed = index.copy()
+    refreshed.refresh(updated)
+
+    for names in (["Ana"], ["Dora"], ["Eva"], ["Bia"], [""]):
+        assert (refreshed.mask(names) == _string_filter(updated, names)).all(), names
+        assert (index.mask(names) == _string_filter(series, names)).all(), names  # o original não muda